@@ -19,10 +19,18 @@ SHIFT_DATA = 4  # P4-P7
 
 
 class LcdI2c(LcdApi):
-    """Implementa uma classe de LCD ligado através de I2C."""
+    """Implementa uma classe de LCD ligado através de I2C.
+
+    Cada byte enviado ao LCD vira quatro escritas no expansor: nibble alto
+    com e sem o pulso de enable e o mesmo para o nibble baixo. Essas
+    escritas são montadas em um buffer alocado uma única vez e enviadas
+    em uma só transação I2C, inclusive para uma sequência de caracteres.
+    """
     def __init__(self, i2c, i2c_addr, num_lines, num_columns):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
+        self._buf = bytearray(4 * num_columns)
+        self._view = memoryview(self._buf)
         self.i2c.writeto(self.i2c_addr, bytes([0]))
         time.sleep_ms(20) 
         self.hal_write_init(self.LCD_FUNCTION_RESET)
@@ -40,53 +48,56 @@ class LcdI2c(LcdApi):
         self.hal_write_command(cmd)
         gc.collect()
 
+    def _pack(self, offset, value, flags):
+        """Monta no buffer as quatro escritas de um byte ao LCD."""
+        flags |= self.backlight << SHIFT_BACKLIGHT
+        high = flags | (((value >> 4) & 0x0F) << SHIFT_DATA)
+        low = flags | ((value & 0x0F) << SHIFT_DATA)
+        buf = self._buf
+        buf[offset] = high | MASK_E
+        buf[offset + 1] = high
+        buf[offset + 2] = low | MASK_E
+        buf[offset + 3] = low
+
     def hal_write_init(self, nibble):
         """Escreve comando para inicalização do LCD."""
         byte = ((nibble >> 4) & 0x0F) << SHIFT_DATA
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
+        self._buf[0] = byte | MASK_E
+        self._buf[1] = byte
+        self.i2c.writeto(self.i2c_addr, self._view[:2])
 
     def hal_backlight_on(self):
         """Liga o backlight."""
-        self.i2c.writeto(self.i2c_addr, bytes([1 << SHIFT_BACKLIGHT]))
-        gc.collect()
+        self._buf[0] = 1 << SHIFT_BACKLIGHT
+        self.i2c.writeto(self.i2c_addr, self._view[:1])
 
     def hal_backlight_off(self):
         """Desliga o bakclight."""
-        self.i2c.writeto(self.i2c_addr, bytes([0]))
-        gc.collect()
+        self._buf[0] = 0
+        self.i2c.writeto(self.i2c_addr, self._view[:1])
 
     def hal_write_command(self, cmd):
         """Escreve um comando ao LCD."""
-        byte = (self.backlight << SHIFT_BACKLIGHT) | (
-            ((cmd >> 4) & 0x0F) << SHIFT_DATA
-        )
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = (self.backlight << SHIFT_BACKLIGHT) | (
-            (cmd & 0x0F) << SHIFT_DATA
-        )
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        self._pack(0, cmd, 0)
+        self.i2c.writeto(self.i2c_addr, self._view[:4])
         if cmd <= 3:
             time.sleep_ms(5)
-        gc.collect()
 
     def hal_write_data(self, data):
         """Escreve um dado ao LCD."""
-        byte = (
-            MASK_RS
-            | (self.backlight << SHIFT_BACKLIGHT)
-            | (((data >> 4) & 0x0F) << SHIFT_DATA)
-        )
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = (
-            MASK_RS
-            | (self.backlight << SHIFT_BACKLIGHT)
-            | ((data & 0x0F) << SHIFT_DATA)
-        )
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
+        self._pack(0, data, MASK_RS)
+        self.i2c.writeto(self.i2c_addr, self._view[:4])
+
+    def write_at(self, cursor_x, cursor_y, data):
+        """Escreve os caracteres de ``data`` a partir da posição indicada.
+
+        ``data`` são os códigos dos caracteres, de uma única linha. Eles
+        vão em uma só transação, já que o LCD avança o endereço sozinho;
+        cada caractere leva quatro bytes no barramento, tempo suficiente
+        para o LCD processar o anterior.
+        """
+        self.move_to(cursor_x, cursor_y)
+        for i, value in enumerate(data):
+            self._pack(4 * i, value, MASK_RS)
+        self.i2c.writeto(self.i2c_addr, self._view[:4 * len(data)])
+        self.cursor_x = cursor_x + len(data)
@@ -1,28 +1,77 @@
 """Firmware desenvolvido para o dispositivo de medição de temperatura e umidade, dispositvo que compõe o projeto de conlusão de curso: Desenvolvimento de um sistema de monitoramento de temperatura e umidade para fábrica de eletrônicos do polo industrial de Manaus."""
 
 # Módulos padrão do MicroPython
-from time import time, sleep
+from time import time, gmtime
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
 import dht
 import network
 import json
+import struct
 import machine
+import ntptime
 from machine import Pin, SoftI2C
 from umqtt.simple import MQTTClient
 
 # Classe local
 from lcd_i2c import LcdI2c
 
+# Diferença entre a época do MicroPython (2000) e a época Unix (1970)
+EPOCH_OFFSET = 946684800 if gmtime(0)[0] == 2000 else 0
+# Instantes anteriores a 2020 indicam relógio ainda não sincronizado
+MIN_VALID_TIME = 1577836800
+PAYLOAD_VERSION = 1
+# Registro binário: sequência, instante, temperatura e umidade (centésimos)
+RECORD_FORMAT = '!IIhh'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+WINDOW_VERSION = 3
+HEARTBEAT_VERSION = 4
+# Lote de registros guardados, cada um seguido de um byte de marcas
+FLAGGED_BATCH_VERSION = 5
+FLAGGED_RECORD_SIZE = RECORD_SIZE + 1
+FLAG_HEARTBEAT = 0x01
+# Agregado de janela: sequência, instante do fim da janela, médias,
+# mínimo e máximo da temperatura e da umidade (centésimos) e amostras
+WINDOW_FORMAT = '!IIhhhhhhH'
+WINDOW_SIZE = struct.calcsize(WINDOW_FORMAT)
+
+
+def payload_header(version: int, id_device: bytes) -> bytes:
+    """Cabeçalho dos payloads binários: versão, tamanho do id e id."""
+    return struct.pack('!BB', version, len(id_device)) + id_device
+
+
+def clock_synced() -> bool:
+    """Verifica se o relógio interno já foi acertado via NTP."""
+    return int(time()) + EPOCH_OFFSET >= MIN_VALID_TIME
+
+
+def live_record(record: bytes) -> bytes:
+    """Registro para envio imediato ao broker.
+
+    Sem o relógio sincronizado, o instante vai como 0 e o servidor usa o
+    horário de chegada; o registro guardado no buffer mantém o relógio
+    interno, para ser corrigido na sincronização.
+    """
+    if clock_synced():
+        return record
+    return record[:4] + bytes(4) + record[8:]
+
 
 class Config:
     """Implementa a classe de armazenamento de todas as variáveis de configuração do projeto."""
-    def __init__(self) -> None:
-        self._CONFIG_PATH = '/config/config.json'
+    def __init__(self, path: str = '/config/config.json') -> None:
+        self._CONFIG_PATH = path
         self._BASIC_CONFIG = {
             'WIFI_SSID': 'ssid',
             'WIFI_PASSWORD': 'password',
             'MQTT_BROKER': 'ip',
             'MQTT_CLIENT': 'sensor_drybox',
             'MQTT_SENSOR_TOPIC': 'sensores/medidas',
+            'MQTT_SENSOR_BIN_TOPIC': 'sensores/v1/medidas',
+            'PAYLOAD_FORMAT': 'bin',
             'MQTT_CONFIG_TOPIC': 'sensores/config',
             'MAC_ADDRESS': 'FFFFFFFFFFFF',
             'TEMP_LIMIT_LOWER': 10.0,
@@ -32,18 +81,32 @@ class Config:
             'HUMI_LIMIT_UPPER': 10.0,
             'HUMI_SETTING': 0.0,
             'DELAY_MEASURE': 20,
+            'TEMP_DEADBAND': 0.0,
+            'TEMP_DEADBAND_PCT': 0.0,
+            'HUMI_DEADBAND': 0.0,
+            'HUMI_DEADBAND_PCT': 0.0,
+            'HEARTBEAT_INTERVAL': 300,
+            'AGGREGATE_WINDOW': 0,
+            'DELAY_SAMPLE': 5,
             'DELAY_BUZZER_ON': 15,
             'DELAY_BUZZER_OFF': 60,
+            'BUFFER_CAPACITY': 2048,
+            'REPLAY_BATCH_SIZE': 30,
+            'RECONNECT_DELAY': 30,
+            'MQTT_KEEPALIVE': 60,
+            'MQTT_TIMEOUT': 5,
         }
         self._config = None
         self._load_config()
 
-    def _verify_keys(self, config: dict) -> bool:
-        """Verifica se o objeto de configuração possui todos os parâmetros necessários."""
-        for key in self._BASIC_CONFIG.keys():
+    def _merge_defaults(self, config: dict) -> bool:
+        """Completa o objeto de configuração com os parâmetros padrão ausentes."""
+        missing = False
+        for key, value in self._BASIC_CONFIG.items():
             if key not in config.keys():
-                return False
-        return True
+                config[key] = value
+                missing = True
+        return missing
 
     def _load_attr(self) -> None:
         """Adiciona atributos de classe de acordo com o objeto de configuração."""
@@ -54,27 +117,32 @@ class Config:
         """Salva o objeto de configuração padrão."""
         with open(self._CONFIG_PATH, 'w') as f:
             f.write(json.dumps(self._BASIC_CONFIG, indent=4))
-        self._config = self._CONFIG_PATH.copy()
+        self._config = self._BASIC_CONFIG.copy()
         self._load_attr()
 
-    def update(self, config: dict = None) -> None:
-        """Salva um objeto de configuração."""
-        if isinstance(config, dict) and config:
-            self._config.update(config)
-            with open(self._CONFIG_PATH, 'w') as f:
-                f.write(json.dumps(self._config))
-            self._load_attr()
+    def update(self, config: dict = None) -> bool:
+        """Salva um objeto de configuração e informa se houve alteração."""
+        if not isinstance(config, dict) or not config:
+            return False
+        changed = {k: v for k, v in config.items() if self._config.get(k) != v}
+        if not changed:
+            return False
+        self._config.update(changed)
+        with open(self._CONFIG_PATH, 'w') as f:
+            f.write(json.dumps(self._config))
+        self._load_attr()
+        return True
 
     def _load_config(self) -> None:
         """Faz a leitura de um arquivo json para obter um objeto de configuração."""
         try:
             with open(self._CONFIG_PATH, 'r') as f:
                 config = json.loads(f.read())
-            if not self._verify_keys(config):
-                self._save_default()
-            else:
-                self._config = config
-                self._load_attr()
+            self._config = config
+            if self._merge_defaults(config):
+                with open(self._CONFIG_PATH, 'w') as f:
+                    f.write(json.dumps(self._config))
+            self._load_attr()
         except Exception as e:
             print(e)
             self._save_default()
@@ -84,8 +152,220 @@ class Config:
         return f'{ {k:v for k,v in self._config.items()} }'
 
 
+class Sequence:
+    """Implementa o número de sequência das medições, mantido entre reinícios.
+
+    Para não gravar a flash a cada medição, reserva blocos de ``step``
+    números: depois de um reinício a contagem continua do fim do último
+    bloco reservado, sem repetir números já usados.
+    """
+    def __init__(self, path: str = '/seq.txt', step: int = 1000) -> None:
+        self._path = path
+        self._step = step
+        try:
+            with open(self._path, 'r') as f:
+                self._value = int(f.read())
+        except Exception:
+            self._value = 0
+        # Primeiro número usado desde o boot
+        self.first = self._value + 1
+        self._reserve()
+
+    def _reserve(self) -> None:
+        """Grava na flash o fim do próximo bloco de números."""
+        self._reserved = self._value + self._step
+        with open(self._path, 'w') as f:
+            f.write(str(self._reserved))
+
+    def next(self) -> int:
+        """Retorna o próximo número de sequência."""
+        self._value += 1
+        if self._value >= self._reserved:
+            self._reserve()
+        return self._value
+
+
+class Buffer:
+    """Implementa o buffer circular em flash das medições não enviadas.
+
+    Cada posição do arquivo guarda um registro binário de tamanho fixo e os
+    registros pendentes ocupam posições consecutivas; com o buffer cheio, o
+    mais antigo é sobrescrito. O último número de sequência confirmado pelo
+    broker fica em um arquivo à parte, usado para reconstruir o estado
+    depois de um reinício.
+    """
+    def __init__(
+        self,
+        path: str = '/buffer.bin',
+        capacity: int = 2048,
+        record_size: int = FLAGGED_RECORD_SIZE,
+    ) -> None:
+        self._path = path
+        self._ack_path = path + '.ack'
+        self._capacity = capacity
+        self.record_size = record_size
+        self._start = 0
+        self._count = 0
+        try:
+            with open(self._ack_path, 'r') as f:
+                self._acked = int(f.read())
+        except Exception:
+            self._acked = 0
+        self._load()
+
+    def _load(self) -> None:
+        """Cria o arquivo, se preciso, e localiza os registros pendentes."""
+        try:
+            with open(self._path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            data = b''
+        if len(data) != self._capacity * self.record_size:
+            with open(self._path, 'wb') as f:
+                for _ in range(self._capacity):
+                    f.write(bytes(self.record_size))
+            return
+        last_slot, last_seq = 0, 0
+        for slot in range(self._capacity):
+            seq = struct.unpack_from('!I', data, slot * self.record_size)[0]
+            if seq > self._acked:
+                self._count += 1
+                if seq > last_seq:
+                    last_slot, last_seq = slot, seq
+        self._start = (last_slot + 1 - self._count) % self._capacity
+
+    def pending(self) -> int:
+        """Quantidade de registros aguardando envio."""
+        return self._count
+
+    def append(self, record: bytes) -> None:
+        """Guarda um registro no fim do buffer."""
+        slot = (self._start + self._count) % self._capacity
+        with open(self._path, 'r+b') as f:
+            f.seek(slot * self.record_size)
+            f.write(record)
+        if self._count < self._capacity:
+            self._count += 1
+        else:
+            self._start = (self._start + 1) % self._capacity
+
+    def peek(self, limit: int) -> list:
+        """Retorna até ``limit`` registros, do mais antigo ao mais novo."""
+        records = []
+        with open(self._path, 'rb') as f:
+            for i in range(min(limit, self._count)):
+                f.seek(
+                    ((self._start + i) % self._capacity) * self.record_size
+                )
+                records.append(f.read(self.record_size))
+        return records
+
+    def rebase(self, first_seq: int, step: int) -> int:
+        """Corrige o instante dos registros pendentes medidos sem horário.
+
+        Soma ``step``, o salto do relógio na sincronização, aos registros
+        a partir de ``first_seq`` (deste boot) com instante anterior a
+        2020. Os de boots anteriores não têm como ser corrigidos. Retorna
+        quantos registros foram corrigidos.
+        """
+        rebased = 0
+        with open(self._path, 'r+b') as f:
+            for i in range(self._count):
+                offset = ((self._start + i) % self._capacity) * self.record_size
+                f.seek(offset)
+                seq, ts = struct.unpack('!II', f.read(8))
+                if seq >= first_seq and ts < MIN_VALID_TIME:
+                    f.seek(offset + 4)
+                    f.write(struct.pack('!I', ts + step))
+                    rebased += 1
+        return rebased
+
+    def ack(self, records: list) -> None:
+        """Descarta registros confirmados pelo broker."""
+        self._start = (self._start + len(records)) % self._capacity
+        self._count -= len(records)
+        self._acked = struct.unpack_from('!I', records[-1])[0]
+        with open(self._ack_path, 'w') as f:
+            f.write(str(self._acked))
+
+
+class Deadband:
+    """Implementa a publicação por exceção das medições.
+
+    Uma leitura só é publicada quando a temperatura ou a umidade varia, em
+    relação ao último valor publicado, mais que a banda morta: a maior
+    entre a absoluta (``*_DEADBAND``) e a relativa (``*_DEADBAND_PCT``, em
+    porcentagem). Sem publicar por ``HEARTBEAT_INTERVAL`` segundos, envia
+    um heartbeat, que não muda o valor de referência: assim uma deriva
+    lenta ainda ultrapassa a banda e é publicada. Com as bandas zeradas,
+    toda leitura é publicada.
+    """
+    def __init__(self, config: Config) -> None:
+        self._config = config
+        self._temp = None
+        self._humi = None
+        self._published_at = None
+
+    def _changed(self, value: float, last: float, absolute, relative) -> bool:
+        """Verifica se a variação ultrapassa a banda morta."""
+        band = max(absolute, abs(last) * relative / 100)
+        return band <= 0 or abs(value - last) > band
+
+    def check(self, temp: float, humi: float, now: int):
+        """Retorna 'change', 'heartbeat' ou None se não deve publicar."""
+        config = self._config
+        if self._published_at is None or (
+            self._changed(
+                temp, self._temp, config.TEMP_DEADBAND, config.TEMP_DEADBAND_PCT
+            )
+            or self._changed(
+                humi, self._humi, config.HUMI_DEADBAND, config.HUMI_DEADBAND_PCT
+            )
+        ):
+            reason = 'change'
+        elif now - self._published_at >= config.HEARTBEAT_INTERVAL:
+            reason = 'heartbeat'
+        else:
+            return None
+        if reason == 'change':
+            self._temp, self._humi = temp, humi
+        self._published_at = now
+        return reason
+
+
+class Window:
+    """Acumula as amostras de uma janela de agregação em memória constante."""
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        """Inicia uma nova janela."""
+        self.count = 0
+        self.temp_sum = 0.0
+        self.humi_sum = 0.0
+        self.temp_min = self.temp_max = None
+        self.humi_min = self.humi_max = None
+
+    def add(self, temp: float, humi: float) -> None:
+        """Soma uma amostra à janela."""
+        if not self.count:
+            self.temp_min = self.temp_max = temp
+            self.humi_min = self.humi_max = humi
+        self.count += 1
+        self.temp_sum += temp
+        self.humi_sum += humi
+        self.temp_min = min(self.temp_min, temp)
+        self.temp_max = max(self.temp_max, temp)
+        self.humi_min = min(self.humi_min, humi)
+        self.humi_max = max(self.humi_max, humi)
+
+
 class Lcd:
-    """Implementa a classe de LCD I2C."""
+    """Implementa a classe de LCD I2C.
+
+    Guarda uma cópia do que está na tela e, a cada mensagem, envia apenas
+    os trechos de cada linha que mudaram.
+    """
     def __init__(self) -> None:
         self._I2C_ADDR = 0x27
         self._I2C_ROWS = 2
@@ -94,18 +374,54 @@ class Lcd:
         self._lcd = LcdI2c(
             self._i2c, self._I2C_ADDR, self._I2C_ROWS, self._I2C_COLUMS
         )
+        # A inicialização do driver limpa a tela
+        self._shown = [
+            bytearray(b' ' * self._I2C_COLUMS) for _ in range(self._I2C_ROWS)
+        ]
+
+    def _layout(self, message: str) -> list:
+        """Distribui a mensagem nas linhas da tela, quebrando como o putstr."""
+        rows = [
+            bytearray(b' ' * self._I2C_COLUMS) for _ in range(self._I2C_ROWS)
+        ]
+        x = y = 0
+        wrapped = False
+        for char in message:
+            if char == '\n':
+                if not wrapped:
+                    x, y = 0, y + 1
+                wrapped = False
+                continue
+            if y >= self._I2C_ROWS:
+                break
+            rows[y][x] = ord(char) & 0xFF
+            x += 1
+            wrapped = x >= self._I2C_COLUMS
+            if wrapped:
+                x, y = 0, y + 1
+        return rows
 
     def clear(self) -> None:
         """Limpa a tela do LCD."""
-        self._lcd.clear()
+        self.write()
 
     def write(self, message: str = '') -> None:
-        """Escreve uma mensagem no LCD."""
-        self._lcd.putstr(message)
+        """Mostra uma mensagem no LCD, a partir do início da tela."""
+        for y, row in enumerate(self._layout(message)):
+            shown = self._shown[y]
+            x = 0
+            while x < self._I2C_COLUMS:
+                if row[x] == shown[x]:
+                    x += 1
+                    continue
+                start = x
+                while x < self._I2C_COLUMS and row[x] != shown[x]:
+                    x += 1
+                self._lcd.write_at(start, y, row[start:x])
+                shown[start:x] = row[start:x]
 
     def write_data(self, data: dict) -> None:
         """Escreve a informação de um objeto no LCD."""
-        self.clear()
         self.write(
             f'Temp: {data["temp_value"]:.2f} \xDFC  Humi: {data["humi_value"]:.2f} %'
         )
@@ -117,12 +433,19 @@ class Lcd:
 
 class Sensor:
     """Implementa a classe de Sensor DHT22."""
-    def __init__(self, config: Config) -> None:
+    def __init__(self, config: Config, sequence: Sequence) -> None:
         self._PIN = 15
         self._config = config
+        self._sequence = sequence
         self._temp = None
         self._humi = None
         self._dht22 = dht.DHT22(Pin(self._PIN))
+        self.window = Window()
+
+    @property
+    def first_seq(self) -> int:
+        """Número de sequência da primeira medição deste boot."""
+        return self._sequence.first
 
     @property
     def temp(self) -> float:
@@ -142,25 +465,92 @@ class Sensor:
         if isinstance(value, float):
             self._humi = value
 
-    def measure(self) -> None:
-        """Realiza a leitura do sensor."""
+    def measure(self) -> bool:
+        """Realiza a leitura do sensor e informa se ela foi bem-sucedida."""
         try:
             self._dht22.measure()
             self.temp = self._dht22.temperature() + self._config.TEMP_SETTING
             self.humi = self._dht22.humidity() + self._config.HUMI_SETTING
+            return True
         except Exception as e:
             print(f'Falha ao ler sensor: {e}')
+            return False
 
     def get(self) -> dict:
         """Retorna um objeto com os últimos valores lidos e o id do dispositivo."""
         return {'id_device': self._config.MQTT_CLIENT,'temp_value': round(self.temp, 2), 'humi_value': round(self.humi, 2)}
 
-    def get_json(self) -> str:
+    def get_json(self, heartbeat: bool = False) -> str:
         """Retorna uma string em formato json com os últimos valores lidos e o id do dispositivo."""
+        data = self.get()
+        if heartbeat:
+            data['heartbeat'] = True
+        return json.dumps(data)
+
+    def _timestamp(self) -> int:
+        """Instante Unix atual.
+
+        Antes da sincronização via NTP o relógio conta a partir do boot e o
+        instante fica anterior a 2020; os registros guardados no buffer são
+        corrigidos quando o relógio for acertado e os enviados na hora vão
+        sem instante (``live_record``).
+        """
+        return int(time()) + EPOCH_OFFSET
+
+    def get_record(self) -> bytes:
+        """Retorna os últimos valores lidos como registro binário numerado."""
+        return struct.pack(
+            RECORD_FORMAT,
+            self._sequence.next(),
+            self._timestamp(),
+            round(self.temp * 100),
+            round(self.humi * 100),
+        )
+
+    def get_window_record(self) -> bytes:
+        """Retorna o agregado da janela como registro binário e a reinicia."""
+        window = self.window
+        record = struct.pack(
+            WINDOW_FORMAT,
+            self._sequence.next(),
+            self._timestamp(),
+            round(window.temp_sum / window.count * 100),
+            round(window.humi_sum / window.count * 100),
+            round(window.temp_min * 100),
+            round(window.temp_max * 100),
+            round(window.humi_min * 100),
+            round(window.humi_max * 100),
+            window.count,
+        )
+        window.reset()
+        return record
+
+    def get_window_json(self, record: bytes) -> str:
+        """Retorna um registro de agregado em formato json."""
+        seq, ts, temp, humi, t_min, t_max, h_min, h_max, count = (
+            struct.unpack(WINDOW_FORMAT, record)
+        )
         return json.dumps(
-            {'id_device': self._config.MQTT_CLIENT,'temp_value': round(self.temp, 2), 'humi_value': round(self.humi, 2)}
+            {
+                'id_device': self._config.MQTT_CLIENT,
+                'seq': seq,
+                'ts': ts,
+                'temp_value': temp / 100,
+                'humi_value': humi / 100,
+                'temp_min': t_min / 100,
+                'temp_max': t_max / 100,
+                'humi_min': h_min / 100,
+                'humi_max': h_max / 100,
+                'samples': count,
+            }
         )
 
+    def get_bin(self, record: bytes, heartbeat: bool = False) -> bytes:
+        """Retorna um registro no formato binário versionado."""
+        id_device = self._config.MQTT_CLIENT.encode()
+        version = HEARTBEAT_VERSION if heartbeat else PAYLOAD_VERSION
+        return payload_header(version, id_device) + record
+
     def __str__(self) -> str:
         """Representa o objeto como texto."""
         return f'Sensor(pin={self._PIN}, temp={self.temp:.2f} \xDFC, humi={self.humi:.2f} %)'
@@ -232,24 +622,44 @@ class Wifi:
         """Verifica de existe conexão WiFi."""
         return self._client.isconnected()
 
-    def connect(self) -> None:
-        """Realiza a conexão WiFi."""
-        self._lcd.clear()
+    async def connect(self, timeout: int = 30) -> bool:
+        """Realiza a conexão WiFi, desistindo depois de ``timeout`` segundos.
+
+        A espera não bloqueia as demais tarefas do dispositivo.
+        """
         self._lcd.write(f'MAC:\n{self.mac}')
-        sleep(2)
+        await asyncio.sleep(2)
         self._client.connect(
             self._config.WIFI_SSID, self._config.WIFI_PASSWORD
         )
+        print('Conectando . . .')
+        self._lcd.write('Conectando . . .')
+        started = time()
         while not self.isconnected():
-            print('Conectando . . .')
-            self._lcd.clear()
-            self._lcd.write('Conectando . . .')
-            sleep(0.1)
+            if time() - started >= timeout:
+                print('WiFi indisponível')
+                self._lcd.write('Sem WiFi')
+                return False
+            await asyncio.sleep(0.5)
         print('WiFi Conectado!')
         print(self._client.ifconfig())
-        self._lcd.clear()
         self._lcd.write('WiFi Conectado!')
-        sleep(2)
+        await asyncio.sleep(2)
+        return True
+
+    def sync_time(self):
+        """Acerta o relógio interno via NTP.
+
+        Retorna o salto do relógio, em segundos, ou None em caso de falha.
+        """
+        try:
+            before = time()
+            ntptime.settime()
+            print('Relógio sincronizado!')
+            return round(time() - before)
+        except Exception as e:
+            print(f'Falha ao sincronizar o relógio: {e}')
+            return None
 
     def __str__(self) -> str:
         """Representa o objeto como texto."""
@@ -257,75 +667,351 @@ class Wifi:
 
 
 class Mqtt:
-    """Implementa a classe de MQTT."""
+    """Implementa a classe de MQTT.
+
+    O umqtt usa sockets bloqueantes: a conexão, a espera do PUBACK e a
+    leitura de mensagens ficam limitadas a ``MQTT_TIMEOUT`` segundos, para
+    um broker que não responde não parar as demais tarefas por mais que
+    isso. Sem tráfego, um PINGREQ mantém a sessão dentro do
+    ``MQTT_KEEPALIVE``.
+    """
     def __init__(self, config: Config, lcd: Lcd) -> None:
         self._config = config
         self._lcd = lcd
+        self._client = None
+        self._sent_at = 0
+        self.connected = False
+
+    def _config_topic(self) -> str:
+        """Tópico retido com a configuração deste dispositivo."""
+        return f'{self._config.MQTT_CONFIG_TOPIC}/{self._config.MQTT_CLIENT}'
 
     def _callback(self, topic, message):
         """Recebe e trata a mensagem recebida."""
-        if topic == self._config.MQTT_CONFIG_TOPIC.encode():
-            print('ESP recebeu uma mensagem!')
+        if topic == self._config_topic().encode():
+            if not message:
+                print('Dispositivo sem configuração no servidor')
+                return
             data = json.loads(message.decode())
             print(f'mensagem:{data}')
-            if 'MQTT_CLIENT' in data.keys():
-                sensor = data.pop('MQTT_CLIENT')
-                if sensor == self._config.MQTT_CLIENT:
-                    self._config.update(data)
-                    print('Configuração atualizada!')
-                    machine.reset()
-                else:
-                    print('A mensagem não é para esse dispositivo')
-            else:
-                print('Sem informação do dispositivo de destino!"')
+            data.pop('MQTT_CLIENT', None)
+            # A mensagem é retida e chega a cada conexão: só reinicia se
+            # a configuração realmente mudou.
+            if self._config.update(data):
+                print('Configuração atualizada!')
+                machine.reset()
 
-    def connect(self) -> None:
+    def connect(self) -> bool:
         """Realiza a conexão com o broker."""
         print('Conectando ao MQTT broker ...', end='')
         try:
             self._client = MQTTClient(
-                self._config.MQTT_CLIENT, self._config.MQTT_BROKER
+                self._config.MQTT_CLIENT,
+                self._config.MQTT_BROKER,
+                keepalive=self._config.MQTT_KEEPALIVE,
             )
             self._client.set_callback(self._callback)
-            self._client.connect()
+            self._client.connect(timeout=self._config.MQTT_TIMEOUT)
+            self._sent_at = time()
             print('Conectado.')
-            self._client.subscribe(self._config.MQTT_CONFIG_TOPIC)
+            self.connected = True
+            self._client.subscribe(self._config_topic(), qos=1)
         except Exception as e:
             print(f'Falha na conexão com o broker: {e}')
-            print(f'Reiniciando . . .')
-            sleep(2)
-            machine.reset()
-        return self._client
+            self.connected = False
+        return self.connected
 
-    def publish(self, topic, data) -> None:
+    def publish(self, topic, data, qos: int = 0) -> None:
         """Publica uma mensagem ao broker."""
         print('\nPublicando uma mensagem...')
-        self._client.publish(topic, data)
+        self._client.publish(topic, data, qos=qos)
+        self._sent_at = time()
         print(data)
 
-    def publish_data(self, data) -> None:
-        """Publica um objeto ao broker."""
-        self.publish(self._config.MQTT_SENSOR_TOPIC, data)
+    def publish_data(self, data, topic: str = None) -> None:
+        """Publica um objeto ao broker com confirmação de entrega (QoS 1)."""
+        self.publish(topic or self._config.MQTT_SENSOR_TOPIC, data, qos=1)
+
+    def _send(self, data, topic: str = None) -> bool:
+        """Publica com QoS 1 e marca a conexão como perdida em caso de falha."""
+        try:
+            self.publish_data(data, topic)
+            return True
+        except Exception as e:
+            print(f'Falha ao publicar: {e}')
+            self.connected = False
+            return False
+
+    def _batch(self, version: int, records: list) -> bytes:
+        """Monta um payload binário com um lote de registros."""
+        id_device = self._config.MQTT_CLIENT.encode()
+        return (
+            payload_header(version, id_device)
+            + struct.pack('!B', len(records))
+            + b''.join(records)
+        )
+
+    def _publish_record(self, record: bytes, data, buffer: Buffer) -> None:
+        """Publica um registro; sem conexão, guarda no buffer.
+
+        Enquanto houver registros no buffer, os novos também vão para ele,
+        para serem enviados na ordem.
+        """
+        if self.connected and not buffer.pending():
+            if self._config.PAYLOAD_FORMAT == 'bin':
+                sent = self._send(data, self._config.MQTT_SENSOR_BIN_TOPIC)
+            else:
+                sent = self._send(data)
+            if sent:
+                return
+        buffer.append(record)
+
+    def publish_reading(
+        self, sensor: Sensor, buffer: Buffer, heartbeat: bool = False
+    ) -> None:
+        """Publica a última leitura no formato de PAYLOAD_FORMAT.
+
+        No buffer o registro leva um byte de marcas, para o heartbeat ser
+        reenviado como tal.
+        """
+        if sensor.temp is None or sensor.humi is None:
+            return
+        record = sensor.get_record()
+        if self._config.PAYLOAD_FORMAT == 'bin':
+            data = sensor.get_bin(live_record(record), heartbeat)
+        else:
+            data = sensor.get_json(heartbeat)
+        flags = FLAG_HEARTBEAT if heartbeat else 0
+        self._publish_record(record + struct.pack('!B', flags), data, buffer)
+
+    def publish_window(self, sensor: Sensor, buffer: Buffer) -> None:
+        """Publica o agregado da janela (média, mínimo, máximo e amostras)."""
+        if not sensor.window.count:
+            return
+        record = sensor.get_window_record()
+        if self._config.PAYLOAD_FORMAT == 'bin':
+            data = self._batch(WINDOW_VERSION, [live_record(record)])
+        else:
+            data = sensor.get_window_json(live_record(record))
+        self._publish_record(record, data, buffer)
+
+    def replay(self, buffer: Buffer) -> None:
+        """Envia um lote de registros do buffer."""
+        records = buffer.peek(self._config.REPLAY_BATCH_SIZE)
+        if not records or not self.connected:
+            return
+        if buffer.record_size == WINDOW_SIZE:
+            data = self._batch(WINDOW_VERSION, records)
+        else:
+            data = self._batch(FLAGGED_BATCH_VERSION, records)
+        if self._send(data, self._config.MQTT_SENSOR_BIN_TOPIC):
+            buffer.ack(records)
+            print(f'{len(records)} medições reenviadas')
 
     def check_msg(self):
-        """Verifica se alguma mensagem foi recebida."""
-        self._client.check_msg()
+        """Verifica se alguma mensagem foi recebida e mantém a sessão ativa."""
+        if not self.connected:
+            return
+        try:
+            self._client.check_msg()
+            # O check_msg do umqtt volta o socket ao modo bloqueante
+            self._client.sock.settimeout(self._config.MQTT_TIMEOUT)
+            if time() - self._sent_at >= self._config.MQTT_KEEPALIVE / 2:
+                self._client.ping()
+                self._sent_at = time()
+        except OSError as e:
+            print(f'Conexão com o broker perdida: {e}')
+            self.connected = False
 
     def __str__(self) -> str:
         """Representa o objeto como texto."""
-        return f'Mqtt(pub_topic={self._config.MQTT_SENSOR_TOPIC},sub_topic={self._config.MQTT_CONFIG_TOPIC})'
+        return f'Mqtt(pub_topic={self._config.MQTT_SENSOR_TOPIC},sub_topic={self._config_topic()})'
+
+
+class Device:
+    """Executa a rotina do dispositivo como tarefas do uasyncio.
+
+    Leitura do sensor, publicação, recepção MQTT, reconexão, buzzer e LCD
+    são tarefas independentes, cada uma com o seu período. Entre elas o
+    processador fica livre no laço de eventos, em vez de preso em
+    ``sleep``.
+    """
+    # Períodos, em segundos, das tarefas que não dependem da configuração
+    PUBLISH_PERIOD = 1
+    RECEIVE_PERIOD = 0.1
+    BUZZER_PERIOD = 0.1
+    DISPLAY_PERIOD = 1
+
+    def __init__(
+        self,
+        config: Config,
+        lcd: Lcd,
+        sensor: Sensor,
+        buffer: Buffer,
+        buzzer: Buzzer,
+        wifi: Wifi,
+        mqtt_client: Mqtt,
+    ) -> None:
+        self._config = config
+        self._lcd = lcd
+        self._sensor = sensor
+        self._buffer = buffer
+        self._buzzer = buzzer
+        self._wifi = wifi
+        self._mqtt = mqtt_client
+        self._deadband = Deadband(config=config)
+        self._measured = False
+        self._shown = None
+        self._window_start = time()
+
+    def _sync_clock(self) -> None:
+        """Acerta o relógio e corrige as medições guardadas sem horário."""
+        synced = clock_synced()
+        step = self._wifi.sync_time()
+        if step is None or synced:
+            return
+        self._window_start += step
+        rebased = self._buffer.rebase(self._sensor.first_seq, step)
+        print(f'{rebased} medições guardadas com o horário corrigido')
+
+    async def _every(self, period: float, step) -> None:
+        """Executa ``step`` a cada ``period`` segundos.
+
+        Uma falha é apenas registrada, para não encerrar a tarefa.
+        """
+        while True:
+            try:
+                step()
+            except Exception as e:
+                print(f'ERRO: {e}')
+            await asyncio.sleep(period)
+
+    def _measure(self) -> None:
+        """Lê o sensor e, no modo de agregação, soma a amostra à janela."""
+        if self._sensor.measure():
+            if self._config.AGGREGATE_WINDOW:
+                self._sensor.window.add(self._sensor.temp, self._sensor.humi)
+            self._measured = True
+
+    def _publish(self) -> None:
+        """Publica a leitura ou a janela pendente e reenvia o buffer."""
+        config = self._config
+        now = time()
+        if config.AGGREGATE_WINDOW:
+            if now - self._window_start >= config.AGGREGATE_WINDOW:
+                self._mqtt.publish_window(self._sensor, self._buffer)
+                self._window_start = now
+        elif self._measured:
+            reason = self._deadband.check(
+                self._sensor.temp, self._sensor.humi, now
+            )
+            if reason is not None:
+                self._mqtt.publish_reading(
+                    self._sensor, self._buffer, heartbeat=reason == 'heartbeat'
+                )
+        self._measured = False
+        if self._mqtt.connected:
+            self._mqtt.replay(self._buffer)
+
+    def _display(self) -> None:
+        """Mostra a última leitura no LCD, se ela mudou."""
+        if self._sensor.temp is None or self._sensor.humi is None:
+            return
+        data = self._sensor.get()
+        if data != self._shown:
+            print(f'Temp: {data["temp_value"]} °C\nHumi: {data["humi_value"]} %')
+            self._lcd.write_data(data=data)
+            self._shown = data
+
+    def _out_of_range(self) -> bool:
+        """Verifica se a última leitura está fora dos limites."""
+        config = self._config
+        temp, humi = self._sensor.temp, self._sensor.humi
+        if temp is None or humi is None:
+            return False
+        return (
+            temp < config.TEMP_LIMIT_LOWER
+            or temp > config.TEMP_LIMIT_UPPER
+            or humi < config.HUMI_LIMIT_LOWER
+            or humi > config.HUMI_LIMIT_UPPER
+        )
+
+    async def _sound(self) -> None:
+        """Toca o buzzer por DELAY_BUZZER_ON segundos enquanto houver
+        leitura fora dos limites, com pausas de DELAY_BUZZER_OFF segundos.
+        """
+        while True:
+            if self._out_of_range():
+                self._buzzer.on()
+                print('buzzer ligado')
+                await asyncio.sleep(self._config.DELAY_BUZZER_ON)
+                self._buzzer.off()
+                print('buzzer desligado')
+                await asyncio.sleep(self._config.DELAY_BUZZER_OFF)
+            else:
+                await asyncio.sleep(self.BUZZER_PERIOD)
+
+    async def _reconnect(self) -> None:
+        """Refaz a conexão WiFi e MQTT a cada RECONNECT_DELAY segundos.
+
+        Também repete a sincronização do relógio enquanto ela não der certo.
+        """
+        while True:
+            await asyncio.sleep(self._config.RECONNECT_DELAY)
+            if self._mqtt.connected and clock_synced():
+                continue
+            try:
+                if self._wifi.isconnected() or await self._wifi.connect():
+                    if not clock_synced():
+                        self._sync_clock()
+                    if not self._mqtt.connected:
+                        self._mqtt.connect()
+            except Exception as e:
+                print(f'ERRO: {e}')
+
+    async def main(self) -> None:
+        """Conecta e executa as tarefas do dispositivo."""
+        if await self._wifi.connect():
+            self._sync_clock()
+            self._mqtt.connect()
+        config = self._config
+        if config.AGGREGATE_WINDOW:
+            delay_measure = config.DELAY_SAMPLE
+        else:
+            delay_measure = config.DELAY_MEASURE
+        tasks = [
+            asyncio.create_task(self._every(delay_measure, self._measure)),
+            asyncio.create_task(
+                self._every(self.PUBLISH_PERIOD, self._publish)
+            ),
+            asyncio.create_task(
+                self._every(self.RECEIVE_PERIOD, self._mqtt.check_msg)
+            ),
+            asyncio.create_task(
+                self._every(self.DISPLAY_PERIOD, self._display)
+            ),
+            asyncio.create_task(self._sound()),
+            asyncio.create_task(self._reconnect()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
 
 
 def run():
     """Cria os objetos necessários e realiza a rotina de medição."""
     config = Config()
     lcd = Lcd()
-    sensor = Sensor(config=config)
-    buzzer = Buzzer()
-    wifi = Wifi(config=config, lcd=lcd)
-    mqtt_client = Mqtt(config=config, lcd=lcd)
-    wifi.connect()
-    mqtt_client.connect()
+    sensor = Sensor(config=config, sequence=Sequence())
+    if config.AGGREGATE_WINDOW:
+        # Registros de tamanhos diferentes ficam em arquivos separados
+        buffer = Buffer(
+            '/buffer_window.bin', config.BUFFER_CAPACITY, WINDOW_SIZE
+        )
+    else:
+        buffer = Buffer(capacity=config.BUFFER_CAPACITY)
 
     print('#### CONFIGURACAO ATUAL ####')
     print(f'# TEMP_LIMIT_LOWER = {config.TEMP_LIMIT_LOWER:5.2f} #')
@@ -335,46 +1021,17 @@ def run():
     print(f'# HUMI_LIMIT_UPPER = {config.HUMI_LIMIT_UPPER:5.2f} #')
     print(f'# HUMI_SETTING     = {config.HUMI_SETTING:5.2f} #')
     print('####################################################')
-    
-    last_read = time() - (config.DELAY_MEASURE + 1)
-    last_buzzer = time() - (config.DELAY_BUZZER_OFF + 1)
-    last_buzzer_on = time() - (config.DELAY_BUZZER_ON + 1)
-    buzzer_on = False
 
-    while True:
-        try:
-            sleep(2)
-            now = time()
-            if now - last_read >= config.DELAY_MEASURE:
-                sensor.measure()
-                data = sensor.get()
-                temp = data['temp_value']
-                humi = data['humi_value']
-                print(f'Temp: {temp} °C\nHumi: {humi} %')
-                mqtt_client.publish_data(sensor.get_json())
-                lcd.write_data(data=data)
-                last_read = time()
-            if (
-                temp < config.TEMP_LIMIT_LOWER
-                or temp > config.TEMP_LIMIT_UPPER
-                or humi < config.HUMI_LIMIT_LOWER
-                or humi > config.HUMI_LIMIT_UPPER
-            ):
-                if not buzzer_on and now - last_buzzer >= config.DELAY_BUZZER_OFF:
-                    buzzer.on()
-                    last_buzzer_on = time()
-                    buzzer_on = True
-                    print('buzzer ligado')
-            if buzzer_on and now - last_buzzer_on >= config.DELAY_BUZZER_ON:
-                buzzer.off()
-                buzzer_on = False
-                print('buzzer desligado')
-                last_buzzer = time()
-            sleep(1)
-            mqtt_client.check_msg()
-            print('. ', end='')
-        except Exception as e:
-            print(f'ERRO: {e}')
+    device = Device(
+        config=config,
+        lcd=lcd,
+        sensor=sensor,
+        buffer=buffer,
+        buzzer=Buzzer(),
+        wifi=Wifi(config=config, lcd=lcd),
+        mqtt_client=Mqtt(config=config, lcd=lcd),
+    )
+    asyncio.run(device.main())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,335 @@
+"""Simulador de frota: executa o firmware do dispositivo no CPython.
+
+Cada dispositivo virtual executa as tarefas da classe ``Device`` do
+firmware (``dispositivo/firmware/main.py``), com módulos substitutos para
+``machine``, ``dht``, ``network``, ``ntptime`` e ``umqtt`` (pasta
+``stubs``). No CPython o firmware usa o ``asyncio`` no lugar do
+``uasyncio``, então todos os dispositivos rodam no laço de eventos de um
+único processo, conectados a um broker MQTT de verdade.
+
+Uso:
+    python simulador.py --devices 1000 --broker localhost
+
+Cada dispositivo tem uma temperatura e uma umidade que oscilam em torno
+de um ponto de operação e, de vez em quando, saem da faixa por alguns
+minutos (excursões), para exercitar os alarmes do servidor.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import tempfile
+from pathlib import Path
+from time import monotonic
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE / 'stubs'))
+sys.path.insert(0, str(HERE.parent / 'firmware'))
+
+import machine
+from _device import current
+import main as firmware
+
+
+class Environment:
+    """Temperatura e umidade de uma estufa, com deriva e excursões.
+
+    Os valores seguem um processo de Ornstein-Uhlenbeck em torno do ponto
+    de operação. Uma excursão soma um desvio que sobe e desce em forma de
+    seno durante ``excursion_duration`` segundos.
+    """
+
+    def __init__(
+        self,
+        temp_setpoint,
+        humi_setpoint,
+        excursion_rate,
+        excursion_duration,
+        rng,
+    ):
+        self.temp_setpoint = temp_setpoint
+        self.humi_setpoint = humi_setpoint
+        self.excursion_rate = excursion_rate
+        self.excursion_duration = excursion_duration
+        self.rng = rng
+        self.temp = temp_setpoint
+        self.humi = humi_setpoint
+        self._updated_at = monotonic()
+        self._excursion = None
+
+    def _drift(self, value, setpoint, sigma, dt):
+        theta = 1 / 600
+        return (
+            value
+            + theta * (setpoint - value) * dt
+            + sigma * math.sqrt(dt) * self.rng.gauss(0, 1)
+        )
+
+    def sample(self):
+        now = monotonic()
+        dt = max(now - self._updated_at, 1e-3)
+        self._updated_at = now
+        self.temp = self._drift(self.temp, self.temp_setpoint, 0.02, dt)
+        self.humi = self._drift(self.humi, self.humi_setpoint, 0.05, dt)
+        self.humi = min(max(self.humi, 0.0), 100.0)
+
+        if (
+            self._excursion is None
+            and self.rng.random() < self.excursion_rate * dt
+        ):
+            self._excursion = (
+                now,
+                self.rng.choice((-1, 1)) * self.rng.uniform(5, 12),
+                self.rng.uniform(3, 10),
+            )
+        temp, humi = self.temp, self.humi
+        if self._excursion is not None:
+            started, temp_offset, humi_offset = self._excursion
+            progress = (now - started) / self.excursion_duration
+            if progress >= 1:
+                self._excursion = None
+            else:
+                shape = math.sin(math.pi * progress)
+                temp += temp_offset * shape
+                humi = min(max(humi + humi_offset * shape, 0.0), 100.0)
+        return temp, humi
+
+
+class VirtualDevice:
+    def __init__(self, index, args, directory, rng):
+        self.id_device = f'{args.prefix}{index:05d}'
+        self.mac = bytes([0x02, 0, 0]) + index.to_bytes(3, 'big')
+        self.config_path = str(directory / f'{self.id_device}.json')
+        self.seq_path = str(directory / f'{self.id_device}.seq')
+        self.buffer_path = str(directory / f'{self.id_device}.bin')
+        self.window_buffer_path = str(
+            directory / f'{self.id_device}_window.bin'
+        )
+        self.environment = Environment(
+            temp_setpoint=rng.uniform(15, 20),
+            humi_setpoint=rng.uniform(3, 7),
+            excursion_rate=args.excursion_rate,
+            excursion_duration=args.excursion_duration,
+            rng=rng,
+        )
+        with open(self.config_path, 'w') as f:
+            json.dump(
+                {
+                    'MQTT_BROKER': args.broker,
+                    'MQTT_CLIENT': self.id_device,
+                    'PAYLOAD_FORMAT': args.format,
+                    'DELAY_MEASURE': args.interval,
+                    'TEMP_DEADBAND': args.temp_deadband,
+                    'HUMI_DEADBAND': args.humi_deadband,
+                    'HEARTBEAT_INTERVAL': args.heartbeat,
+                    'AGGREGATE_WINDOW': args.window,
+                    'DELAY_SAMPLE': args.sample,
+                },
+                f,
+            )
+
+
+class Stats:
+    def __init__(self):
+        self.published = 0
+        self.connected = 0
+        self.resets = 0
+        self.errors = 0
+        self.buffered = 0
+
+
+class _NullLcd:
+    """LCD sem hardware: o driver real dorme a cada byte enviado."""
+
+    def clear(self):
+        pass
+
+    def write(self, message=''):
+        pass
+
+    def write_data(self, data):
+        pass
+
+
+class _CountingMqtt(firmware.Mqtt):
+    """``Mqtt`` do firmware que contabiliza as publicações e o buffer."""
+
+    def __init__(self, config, lcd, stats):
+        super().__init__(config=config, lcd=lcd)
+        self._stats = stats
+
+    def _publish_record(self, record, data, buffer):
+        super()._publish_record(record, data, buffer)
+        self._stats.published += 1
+        self._stats.buffered = max(self._stats.buffered, buffer.pending())
+
+
+async def boot(device, stats):
+    """Equivalente ao ``run()`` do firmware, com arquivos por dispositivo."""
+    config = firmware.Config(path=device.config_path)
+    lcd = _NullLcd()
+    if config.AGGREGATE_WINDOW:
+        buffer = firmware.Buffer(
+            device.window_buffer_path,
+            config.BUFFER_CAPACITY,
+            firmware.WINDOW_SIZE,
+        )
+    else:
+        buffer = firmware.Buffer(device.buffer_path, config.BUFFER_CAPACITY)
+    runner = firmware.Device(
+        config=config,
+        lcd=lcd,
+        sensor=firmware.Sensor(
+            config=config, sequence=firmware.Sequence(device.seq_path)
+        ),
+        buffer=buffer,
+        buzzer=firmware.Buzzer(),
+        wifi=firmware.Wifi(config=config, lcd=lcd),
+        mqtt_client=_CountingMqtt(config=config, lcd=lcd, stats=stats),
+    )
+    stats.connected += 1
+    try:
+        await runner.main()
+    finally:
+        stats.connected -= 1
+
+
+async def run_device(device, stats, delay):
+    current.set(device)
+    await asyncio.sleep(delay)
+    while True:
+        try:
+            await boot(device, stats)
+        except machine.Reset:
+            stats.resets += 1
+        except Exception as e:
+            stats.errors += 1
+            print(f'{device.id_device}: {e!r}', file=sys.stderr)
+        await asyncio.sleep(2)
+
+
+async def report(stats, interval):
+    started = monotonic()
+    last = 0
+    while True:
+        await asyncio.sleep(interval)
+        elapsed = monotonic() - started
+        print(
+            f'{elapsed:7.0f} s  conectados={stats.connected}  '
+            f'publicadas={stats.published} '
+            f'({(stats.published - last) / interval:.1f}/s)  '
+            f'reinícios={stats.resets}  erros={stats.errors}  '
+            f'maior buffer={stats.buffered}'
+        )
+        last = stats.published
+
+
+async def simulate(args):
+    directory = Path(tempfile.mkdtemp(prefix='simulador-'))
+    rng = random.Random(args.seed)
+    devices = [
+        VirtualDevice(index, args, directory, random.Random(rng.random()))
+        for index in range(args.devices)
+    ]
+    stats = Stats()
+    tasks = [
+        asyncio.create_task(
+            run_device(device, stats, args.ramp * index / len(devices))
+        )
+        for index, device in enumerate(devices)
+    ]
+    tasks.append(asyncio.create_task(report(stats, args.report)))
+    if args.duration:
+        await asyncio.sleep(args.duration)
+        for task in tasks:
+            task.cancel()
+    else:
+        await asyncio.gather(*tasks)
+    print(f'Total publicado: {stats.published}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--prefix', default='sim_')
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=20,
+        help='segundos entre medições (DELAY_MEASURE)',
+    )
+    parser.add_argument(
+        '--temp-deadband',
+        type=float,
+        default=0,
+        help='banda morta da temperatura (TEMP_DEADBAND, 0 = publica '
+        'toda medição)',
+    )
+    parser.add_argument(
+        '--humi-deadband',
+        type=float,
+        default=0,
+        help='banda morta da umidade (HUMI_DEADBAND)',
+    )
+    parser.add_argument(
+        '--heartbeat',
+        type=float,
+        default=300,
+        help='segundos sem publicar até um heartbeat (HEARTBEAT_INTERVAL)',
+    )
+    parser.add_argument(
+        '--window',
+        type=float,
+        default=0,
+        help='janela de agregação em segundos (AGGREGATE_WINDOW, 0 = '
+        'publica cada medição)',
+    )
+    parser.add_argument(
+        '--sample',
+        type=float,
+        default=5,
+        help='segundos entre amostras com agregação (DELAY_SAMPLE)',
+    )
+    parser.add_argument('--format', choices=('bin', 'json'), default='bin')
+    parser.add_argument(
+        '--ramp',
+        type=float,
+        default=10,
+        help='segundos para conectar todos os dispositivos',
+    )
+    parser.add_argument(
+        '--excursion-rate',
+        type=float,
+        default=1 / 3600,
+        help='excursões por segundo, por dispositivo',
+    )
+    parser.add_argument(
+        '--excursion-duration',
+        type=float,
+        default=300,
+        help='duração de uma excursão, em segundos',
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=0,
+        help='encerra depois desse tempo, em segundos (0 = sem limite)',
+    )
+    parser.add_argument('--report', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        # O firmware escreve no console a cada passo
+        firmware.print = lambda *args, **kwargs: None
+    asyncio.run(simulate(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+"""Dispositivo virtual em execução na tarefa asyncio atual."""
+from contextvars import ContextVar
+
+current = ContextVar('current_device')
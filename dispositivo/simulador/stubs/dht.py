@@ -0,0 +1,21 @@
+"""Substituto do módulo ``dht`` que lê o ambiente simulado do dispositivo."""
+from _device import current
+
+
+class DHT22:
+    def __init__(self, pin):
+        self._environment = current.get().environment
+        self._temperature = None
+        self._humidity = None
+
+    def measure(self):
+        temperature, humidity = self._environment.sample()
+        # O DHT22 tem resolução de 0,1 °C e 0,1 %
+        self._temperature = round(temperature, 1)
+        self._humidity = round(humidity, 1)
+
+    def temperature(self):
+        return self._temperature
+
+    def humidity(self):
+        return self._humidity
@@ -0,0 +1,53 @@
+"""Substituto do módulo ``machine`` do MicroPython para o simulador."""
+from _device import current
+
+
+class Reset(BaseException):
+    """Levantada por ``reset()``; o simulador reinicia o dispositivo.
+
+    Deriva de ``BaseException`` para atravessar os ``except Exception`` do
+    firmware, como o reinício de verdade, que nunca retorna.
+    """
+
+
+def reset():
+    raise Reset()
+
+
+def unique_id():
+    return current.get().mac
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+
+    def __init__(self, pin, mode=IN, value=None):
+        self.pin = pin
+        self.mode = mode
+        self._value = value or 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = int(bool(value))
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+
+class I2C:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def writeto(self, addr, buf, stop=True):
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return bytes(nbytes)
+
+
+SoftI2C = I2C
@@ -0,0 +1,33 @@
+"""Substituto do módulo ``network``: a conexão WiFi é sempre imediata."""
+from _device import current
+
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self._active = False
+        self._connected = False
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+
+    def config(self, name):
+        if name == 'mac':
+            return current.get().mac
+        raise ValueError(name)
+
+    def connect(self, ssid=None, password=None):
+        self._connected = True
+
+    def disconnect(self):
+        self._connected = False
+
+    def isconnected(self):
+        return self._connected
+
+    def ifconfig(self):
+        return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
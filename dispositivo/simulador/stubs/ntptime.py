@@ -0,0 +1,5 @@
+"""Substituto do módulo ``ntptime``: o relógio do CPython já está certo."""
+
+
+def settime():
+    pass
@@ -0,0 +1,110 @@
+"""Substituto do ``umqtt.simple`` implementado sobre o paho-mqtt.
+
+Mantém a interface síncrona do umqtt, sem threads: o tráfego de rede,
+inclusive confirmações de QoS 1 e keepalive, é processado a cada
+``check_msg()`` e ``publish()``. Falhas de rede levantam ``OSError``, como
+os sockets do MicroPython, e o tempo limite de ``connect()`` vale para a
+conexão e para a espera do PUBACK.
+"""
+from time import monotonic
+import paho.mqtt.client as paho
+
+
+class MQTTException(Exception):
+    pass
+
+
+class _Socket:
+    """Guarda o tempo limite definido pelo firmware com ``settimeout``."""
+
+    def __init__(self):
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+
+class MQTTClient:
+    def __init__(
+        self,
+        client_id,
+        server,
+        port=0,
+        user=None,
+        password=None,
+        keepalive=0,
+        ssl=False,
+        ssl_params={},
+    ):
+        if isinstance(client_id, bytes):
+            client_id = client_id.decode()
+        self.server = server
+        self.port = port or 1883
+        self.keepalive = keepalive or 60
+        self._callback = None
+        self.sock = _Socket()
+        self._client = paho.Client(client_id=client_id, clean_session=True)
+        if user is not None:
+            self._client.username_pw_set(user, password)
+        self._client.on_message = self._on_message
+
+    def _on_message(self, client, userdata, message):
+        if self._callback is not None:
+            self._callback(message.topic.encode(), message.payload)
+
+    def set_callback(self, callback):
+        self._callback = callback
+
+    def _deadline(self):
+        if self.sock.timeout is None:
+            return None
+        return monotonic() + self.sock.timeout
+
+    def _wait(self, done, deadline, error):
+        while not done():
+            if deadline is not None and monotonic() >= deadline:
+                raise OSError(110, 'ETIMEDOUT')
+            if self._client.loop(timeout=1.0) != paho.MQTT_ERR_SUCCESS:
+                raise error
+
+    def connect(self, clean_session=True, timeout=None):
+        self.sock.settimeout(timeout)
+        if timeout is not None:
+            self._client._connect_timeout = timeout
+        self._client.connect(self.server, self.port, self.keepalive)
+        self._wait(
+            self._client.is_connected,
+            self._deadline(),
+            MQTTException('Falha na conexão com o broker'),
+        )
+        return 0
+
+    def disconnect(self):
+        self._client.disconnect()
+
+    def ping(self):
+        self._client.loop(timeout=0)
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        """Publica; com QoS 1, espera o PUBACK, como o umqtt."""
+        info = self._client.publish(topic, msg, qos=qos, retain=retain)
+        if info.rc != paho.MQTT_ERR_SUCCESS:
+            raise OSError(info.rc, 'Falha ao publicar')
+        if qos:
+            self._wait(
+                info.is_published,
+                self._deadline(),
+                OSError('Conexão com o broker perdida'),
+            )
+        self._client.loop(timeout=0)
+
+    def subscribe(self, topic, qos=0):
+        self._client.subscribe(topic, qos=qos)
+        self._client.loop(timeout=0)
+
+    def check_msg(self):
+        if self._client.loop(timeout=0) != paho.MQTT_ERR_SUCCESS:
+            raise OSError('Conexão com o broker perdida')
+
+    def wait_msg(self):
+        self._client.loop(timeout=1.0)
@@ -0,0 +1,86 @@
+"""Mede a vazão do decodificador de medições, isolado do restante do app.
+
+Uso: python benchmarks/bench_decoder.py [--messages N]
+"""
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'web_server'))
+
+from decoder import DecodeError, decode_reading, decode_binary, encode_binary
+
+
+def synthetic_payloads(count, devices=500):
+    return [
+        json.dumps(
+            {
+                'id_device': f'sensor_{random.randrange(devices):04d}',
+                'temp_value': round(random.uniform(15, 30), 2),
+                'humi_value': round(random.uniform(0, 60), 2),
+            }
+        ).encode()
+        for _ in range(count)
+    ]
+
+
+def binary_payloads(payloads):
+    readings = [json.loads(payload) for payload in payloads]
+    return [
+        encode_binary(
+            reading['id_device'],
+            seq,
+            1700000000 + seq,
+            reading['temp_value'],
+            reading['humi_value'],
+        )
+        for seq, reading in enumerate(readings)
+    ]
+
+
+def json_baseline(payload):
+    data = json.loads(payload.decode())
+    return data['id_device'], data['temp_value'], data['humi_value']
+
+
+def measure(function, payloads):
+    start = perf_counter()
+    for payload in payloads:
+        try:
+            function(payload)
+        except DecodeError:
+            pass
+    return len(payloads) / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=500000)
+    args = parser.parse_args()
+
+    payloads = synthetic_payloads(args.messages)
+    invalid = [payload[: len(payload) // 2] for payload in payloads]
+    binary = binary_payloads(payloads)
+
+    results = (
+        ('json.loads (anterior)', measure(json_baseline, payloads)),
+        ('decode_reading', measure(decode_reading, payloads)),
+        ('decode_reading (inválidas)', measure(decode_reading, invalid)),
+        ('decode_binary', measure(decode_binary, binary)),
+    )
+    print(
+        'Tamanho médio: JSON %.1f bytes, binário %.1f bytes'
+        % (
+            sum(map(len, payloads)) / len(payloads),
+            sum(map(len, binary)) / len(binary),
+        )
+    )
+    for name, rate in results:
+        print(f'{name:<28}{rate:>14,.0f} msg/s')
+
+
+if __name__ == '__main__':
+    main()
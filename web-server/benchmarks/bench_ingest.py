@@ -0,0 +1,348 @@
+"""Mede a vazão, a latência e as alocações da ingestão de medições.
+
+Percorre o caminho real, do callback MQTT (``handle_mqtt_message``) ao
+commit no PostgreSQL feito pelo ``RegisterWriter``, com mensagens
+sintéticas e sem broker. Usa o banco de ``DB_URL``: prefira um banco
+descartável, porque as medições sintéticas ficam gravadas.
+
+Etapas medidas:
+
+- ``decode``: decodificação do payload, isolada.
+- ``app_context``: abertura e fechamento de um contexto de aplicação.
+- ``handler``: callback MQTT completo até a fila, com alocações.
+- ``flush``: gravação direta de um lote, por parte (INSERT, tabela de
+  últimas medições, rollups, alarmes e commit), com alocações.
+- ``e2e``: mensagens entregues ao callback a uma taxa fixa, medindo a
+  vazão e a latência até o commit de cada uma.
+
+Uso:
+    python benchmarks/bench_ingest.py [--messages N] [--format json|bin]
+        [--rate MSG/S] [--save ARQUIVO] [--compare ARQUIVO]
+
+Com ``--compare``, os resultados são comparados com uma linha de base
+salva antes com ``--save`` e o script sai com código 1 se alguma métrica
+piorar mais que ``--tolerance``.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import tracemalloc
+import types
+from collections import deque
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+from time import perf_counter, sleep, time
+
+WEB_SERVER = Path(__file__).resolve().parent.parent / 'web_server'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def synthetic_messages(count, payload_format, devices=500):
+    from decoder import encode_binary
+
+    messages = []
+    # Um instante por execução, para as medições não serem descartadas
+    # como reenvio das de uma execução anterior
+    ts = int(time())
+    for seq in range(count):
+        id_device = f'bench_{random.randrange(devices):04d}'
+        temp_value = round(random.uniform(15, 30), 2)
+        humi_value = round(random.uniform(0, 60), 2)
+        if payload_format == 'bin':
+            payload = encode_binary(
+                id_device, seq, ts, temp_value, humi_value
+            )
+            topic = 'sensores/v1/medidas'
+        else:
+            payload = json.dumps(
+                {
+                    'id_device': id_device,
+                    'temp_value': temp_value,
+                    'humi_value': humi_value,
+                }
+            ).encode()
+            topic = 'sensores/medidas'
+        messages.append(types.SimpleNamespace(topic=topic, payload=payload))
+    return messages
+
+
+def timed(function, totals, name):
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            totals[name] = totals.get(name, 0.0) + perf_counter() - start
+
+    return wrapper
+
+
+def drain(writer):
+    while not writer._queue.empty():
+        writer._queue.get_nowait()
+
+
+def bench_decode(messages):
+    from ingest import DECODERS
+
+    start = perf_counter()
+    for message in messages:
+        DECODERS[message.topic](message.payload)
+    return (perf_counter() - start) / len(messages) * 1e6
+
+
+def bench_app_context(app, rounds=10000):
+    start = perf_counter()
+    for _ in range(rounds):
+        with app.app_context():
+            pass
+    return (perf_counter() - start) / rounds * 1e6
+
+
+def bench_handler(messages, writer):
+    from ingest import handle_mqtt_message
+
+    start = perf_counter()
+    for message in messages:
+        handle_mqtt_message(None, None, message)
+    rate = len(messages) / (perf_counter() - start)
+    drain(writer)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for message in messages:
+        handle_mqtt_message(None, None, message)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    drain(writer)
+    stats = after.compare_to(before, 'filename')
+    allocated = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    return rate, allocated / len(messages), blocks / len(messages)
+
+
+def bench_flush(messages, writer):
+    import ingest
+
+    readings = [
+        reading
+        for message in messages[: writer.batch_size]
+        for reading in ingest.DECODERS[message.topic](message.payload)
+    ]
+    rounds = 5
+    # Um instante por rodada: repetir (id_device, seq, created_at) faria
+    # o INSERT descartar as linhas como duplicadas.
+    batches = [
+        [
+            dict(
+                id_device=reading.id_device,
+                temp_value=reading.temp_value,
+                humi_value=reading.humi_value,
+                seq=reading.seq,
+                created_at=created_at,
+            )
+            for reading in readings
+        ]
+        for created_at in (
+            datetime.now(UTC) + timedelta(microseconds=index)
+            for index in range(rounds + 1)
+        )
+    ]
+    batch = batches[0]
+
+    totals = {}
+    originals = (
+        ingest.update_rollups,
+        writer._update_latest,
+        writer.alarms.evaluate,
+    )
+    ingest.update_rollups = timed(ingest.update_rollups, totals, 'rollups')
+    writer._update_latest = timed(writer._update_latest, totals, 'latest')
+    writer.alarms.evaluate = timed(writer.alarms.evaluate, totals, 'alarms')
+    try:
+        start = perf_counter()
+        for batch in batches[:rounds]:
+            writer._flush(batch)
+        total = perf_counter() - start
+        parts = {name: value / rounds * 1000 for name, value in totals.items()}
+
+        tracemalloc.start()
+        writer._flush(batches[rounds])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        (
+            ingest.update_rollups,
+            writer._update_latest,
+            writer.alarms.evaluate,
+        ) = originals
+
+    parts['insert_commit'] = total / rounds * 1000 - sum(parts.values())
+    return len(batch), total / rounds * 1000, parts, peak / len(batch)
+
+
+def bench_e2e(messages, writer, rate):
+    from ingest import handle_mqtt_message
+
+    pending = deque()
+    latencies = []
+    flush = writer._flush
+
+    def timed_flush(batch, rejects=()):
+        written = flush(batch, rejects)
+        done = perf_counter()
+        if written:
+            for _ in batch:
+                latencies.append(done - pending.popleft())
+        return written
+
+    writer._flush = timed_flush
+    writer.start()
+    interval = 1 / rate if rate else 0
+    start = perf_counter()
+    for index, message in enumerate(messages):
+        if interval:
+            delay = start + index * interval - perf_counter()
+            if delay > 0:
+                sleep(delay)
+        pending.append(perf_counter())
+        handle_mqtt_message(None, None, message)
+    timeout = perf_counter() + 60
+    while len(latencies) < len(messages) and perf_counter() < timeout:
+        sleep(0.01)
+    elapsed = perf_counter() - start
+    writer.stop()
+    writer._flush = flush
+    if len(latencies) < len(messages):
+        print(
+            f'Aviso: só {len(latencies)} de {len(messages)} mensagens '
+            'foram gravadas no banco',
+            file=sys.stderr,
+        )
+    return (
+        len(latencies) / elapsed,
+        percentile(latencies, 0.5) * 1000,
+        percentile(latencies, 0.99) * 1000,
+    )
+
+
+def run(args):
+    os.environ.setdefault('DEBUG', '0')
+    os.environ.setdefault('MQTT_BROKER_URL', 'localhost')
+    os.environ.setdefault('MQTT_BROKER_PORT', '1883')
+    os.environ['MQTT_INGEST'] = '0'
+    os.environ['INGEST_QUEUE_SIZE'] = str(args.messages * 2)
+    os.environ['INGEST_SPOOL_DIR'] = tempfile.mkdtemp(prefix='bench-spool-')
+    sys.path.insert(0, str(WEB_SERVER))
+
+    from app import app
+    from ingest import writer
+
+    random.seed(args.seed)
+    messages = synthetic_messages(args.messages, args.format)
+    handler_rate, alloc_bytes, alloc_blocks = bench_handler(messages, writer)
+    batch_size, flush_ms, flush_parts, flush_bytes = bench_flush(
+        messages, writer
+    )
+    e2e_rate, p50, p99 = bench_e2e(messages, writer, args.rate)
+    return dict(
+        meta=dict(
+            date=datetime.now(UTC).isoformat(timespec='seconds'),
+            python=platform.python_version(),
+            machine=platform.machine(),
+            cpus=os.cpu_count(),
+            messages=args.messages,
+            format=args.format,
+            rate=args.rate,
+            batch_size=batch_size,
+        ),
+        results={
+            'decode_us_per_msg': bench_decode(messages),
+            'app_context_us': bench_app_context(app),
+            'handler_msgs_per_s': handler_rate,
+            'handler_alloc_bytes_per_msg': alloc_bytes,
+            'handler_alloc_blocks_per_msg': alloc_blocks,
+            'flush_ms_per_batch': flush_ms,
+            **{
+                f'flush_{name}_ms_per_batch': value
+                for name, value in sorted(flush_parts.items())
+            },
+            'flush_peak_alloc_bytes_per_row': flush_bytes,
+            'e2e_msgs_per_s': e2e_rate,
+            'e2e_p50_ms': p50,
+            'e2e_p99_ms': p99,
+        },
+    )
+
+
+def higher_is_better(name):
+    return name.endswith('_per_s')
+
+
+def compare(results, baseline, tolerance):
+    """Imprime a comparação e retorna as métricas que pioraram."""
+    regressions = []
+    print(f'{"métrica":<36}{"base":>14}{"atual":>14}{"variação":>10}')
+    for name, value in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f'{name:<36}{"-":>14}{value:>14.2f}')
+            continue
+        change = (value - base) / base
+        worse = -change if higher_is_better(name) else change
+        flag = ''
+        if worse > tolerance:
+            flag = '  PIOROU'
+            regressions.append(name)
+        print(f'{name:<36}{base:>14.2f}{value:>14.2f}{change:>+10.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--format', choices=('json', 'bin'), default='json')
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=5000,
+        help='mensagens por segundo na etapa e2e (0 = sem limite)',
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', type=Path)
+    parser.add_argument('--compare', type=Path)
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args()
+
+    report = run(args)
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare(
+            report['results'], baseline['results'], args.tolerance
+        )
+    else:
+        for name, value in report['results'].items():
+            print(f'{name:<36}{value:>14.2f}')
+        regressions = []
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(report, indent=2) + '\n')
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
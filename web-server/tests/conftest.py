@@ -0,0 +1,75 @@
+"""Configuração dos testes do servidor web.
+
+Os testes que acessam o banco usam o de ``DB_URL``, como o servidor, e
+são ignorados sem ele. Prefira um banco descartável.
+"""
+import json
+import os
+import sys
+import types
+from pathlib import Path
+import pytest
+
+os.environ.setdefault('DEBUG', '0')
+os.environ.setdefault('SECRET_KEY', 'testes')
+os.environ.setdefault('MQTT_BROKER_URL', 'localhost')
+os.environ.setdefault('MQTT_BROKER_PORT', '1883')
+os.environ['MQTT_INGEST'] = '0'
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'web_server'))
+
+FIRMWARE = Path(__file__).resolve().parents[2] / 'dispositivo'
+
+
+@pytest.fixture(scope='session')
+def app():
+    if not os.environ.get('DB_URL'):
+        pytest.skip('DB_URL não definida')
+    from app import app
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def firmware(monkeypatch):
+    """Firmware do dispositivo, com os substitutos do simulador."""
+    monkeypatch.syspath_prepend(str(FIRMWARE / 'simulador' / 'stubs'))
+    monkeypatch.syspath_prepend(str(FIRMWARE / 'firmware'))
+    import main
+
+    return main
+
+
+@pytest.fixture
+def board(firmware, tmp_path):
+    """Sensor, buffer e cliente MQTT do firmware, sem hardware nem broker."""
+    from _device import current
+
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps({'MQTT_CLIENT': 'ingest_test'}))
+    config = firmware.Config(str(config_path))
+    token = current.set(types.SimpleNamespace(environment=None))
+    try:
+        sequence = firmware.Sequence(str(tmp_path / 'seq.txt'))
+        sensor = firmware.Sensor(config, sequence)
+    finally:
+        current.reset(token)
+    sensor.temp, sensor.humi = 20.0, 40.0
+    published = []
+    mqtt = firmware.Mqtt(config, lcd=None)
+    mqtt._client = types.SimpleNamespace(
+        publish=lambda topic, data, qos: published.append(data)
+    )
+    mqtt.connected = True
+    return types.SimpleNamespace(
+        config=config,
+        sensor=sensor,
+        buffer=firmware.Buffer(str(tmp_path / 'buffer.bin'), capacity=8),
+        mqtt=mqtt,
+        published=published,
+    )
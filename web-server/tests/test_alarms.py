@@ -0,0 +1,129 @@
+import types
+from datetime import datetime, timedelta, UTC
+import pytest
+
+START = datetime(2024, 1, 1, tzinfo=UTC)
+DEVICE = types.SimpleNamespace(
+    temp_limit_lower=10,
+    temp_limit_upper=30,
+    humi_limit_lower=20,
+    humi_limit_upper=60,
+)
+
+
+@pytest.fixture
+def stored():
+    """Alarmes abertos no banco, como ``open_alarms`` os retorna."""
+    return []
+
+
+@pytest.fixture
+def engine(stored):
+    from alarms import AlarmEngine
+
+    def open_alarms(ids_device=None):
+        return [
+            alarm
+            for alarm in stored
+            if ids_device is None or alarm.id_device in ids_device
+        ]
+
+    registry = types.SimpleNamespace(
+        get=lambda id_device: DEVICE if id_device.startswith('a') else None
+    )
+    return AlarmEngine(registry, open_alarms, hysteresis=1, min_duration=60)
+
+
+def reading(seconds, temp, id_device='a1', **fields):
+    return dict(
+        id_device=id_device,
+        temp_value=temp,
+        humi_value=40,
+        created_at=START + timedelta(seconds=seconds),
+        **fields,
+    )
+
+
+def open_alarm(id_device, variable):
+    return types.SimpleNamespace(
+        id_device=id_device, variable=variable, created_at=START
+    )
+
+
+def actions(events):
+    return [(event['variable'], event['action']) for event in events]
+
+
+def test_alarm_opens_after_min_duration(engine):
+    assert engine.evaluate([reading(0, 31), reading(30, 32)]) == []
+    (event,) = engine.evaluate([reading(60, 33)])
+    assert actions([event]) == [('temp', 'ABERTO')]
+    assert (event['value'], event['limit_upper']) == (33, 30)
+    assert engine.evaluate([reading(120, 34)]) == []
+
+
+def test_short_excursion_does_not_open(engine):
+    events = engine.evaluate(
+        [reading(0, 31), reading(50, 20), reading(70, 31), reading(100, 31)]
+    )
+    assert events == []
+    # A contagem recomeça na segunda saída da faixa
+    assert actions(engine.evaluate([reading(130, 31)])) == [
+        ('temp', 'ABERTO')
+    ]
+
+
+def test_alarm_closes_only_past_hysteresis(engine):
+    engine.evaluate([reading(0, 5), reading(60, 5)])
+    assert engine.evaluate([reading(90, 10.5), reading(100, 29.5)]) == []
+    assert actions(engine.evaluate([reading(110, 11)])) == [
+        ('temp', 'FECHADO')
+    ]
+    assert engine.evaluate([reading(120, 10.5)]) == []
+
+
+def test_window_extreme_is_evaluated(engine):
+    window = dict(temp_min=18, temp_max=35)
+    engine.evaluate([reading(0, 22, **window)])
+    (event,) = engine.evaluate([reading(60, 22, **window)])
+    assert (event['action'], event['value']) == ('ABERTO', 35)
+
+
+def test_batch_is_evaluated_in_time_order(engine):
+    events = engine.evaluate([reading(60, 31), reading(0, 31)])
+    assert actions(events) == [('temp', 'ABERTO')]
+
+
+def test_unknown_device_is_ignored(engine):
+    batch = [reading(0, 50, 'b1'), reading(60, 50, 'b1')]
+    assert engine.evaluate(batch) == []
+
+
+def test_open_alarms_are_seeded_from_database(engine, stored):
+    stored.append(open_alarm('a1', 'temp'))
+    # Já aberto: continua fora da faixa sem novo evento e fecha ao voltar
+    assert engine.evaluate([reading(0, 35)]) == []
+    assert actions(engine.evaluate([reading(10, 20)])) == [
+        ('temp', 'FECHADO')
+    ]
+
+
+def test_forget_reloads_only_that_device(engine, stored):
+    engine.evaluate([reading(0, 31, 'a1'), reading(0, 31, 'a2')])
+    stored.append(open_alarm('a1', 'humi'))
+    engine.forget('a1')
+    events = engine.evaluate([reading(60, 31, 'a1'), reading(60, 31, 'a2')])
+    # a1 perdeu a saída da faixa em andamento e passou a ter o alarme de
+    # umidade do banco; a2 manteve o seu estado
+    assert [
+        (event['id_device'], event['variable'], event['action'])
+        for event in events
+    ] == [('a1', 'humi', 'FECHADO'), ('a2', 'temp', 'ABERTO')]
+
+
+def test_forget_all_reseeds(engine, stored):
+    engine.evaluate([reading(0, 31)])
+    stored.append(open_alarm('a1', 'temp'))
+    engine.forget()
+    assert engine.evaluate([reading(10, 35)]) == []
+    assert ('a1', 'temp') in engine._state
@@ -0,0 +1,85 @@
+from datetime import datetime, UTC
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture
+def devices(app):
+    """Cria dispositivos de teste e os remove no fim.
+
+    Metade dos dispositivos tem medição, para a página passar pelos dois
+    casos.
+    """
+    from app import db
+    from models import TbDevices, TbDeviceLatest
+    from registry import registry
+
+    created = []
+
+    def create(count):
+        with app.app_context():
+            for _ in range(count):
+                id_device = f'test_dash_{len(created):04d}'
+                db.session.add(
+                    TbDevices(
+                        id_device=id_device,
+                        temp_limit_upper=30,
+                        temp_limit_lower=10,
+                        temp_limit_setting=20,
+                        humi_limit_upper=60,
+                        humi_limit_lower=20,
+                        humi_limit_setting=40,
+                    )
+                )
+                if len(created) % 2:
+                    db.session.add(
+                        TbDeviceLatest(
+                            id_device=id_device,
+                            temp_value=20,
+                            humi_value=40,
+                            created_at=datetime.now(UTC),
+                        )
+                    )
+                created.append(id_device)
+            db.session.commit()
+        registry.invalidate()
+
+    yield create
+    with app.app_context():
+        for model in (TbDeviceLatest, TbDevices):
+            db.session.execute(
+                db.delete(model).where(model.id_device.in_(created))
+            )
+        db.session.commit()
+    registry.invalidate()
+
+
+def count_queries(app, client, path):
+    from app import db
+    from registry import registry
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    registry.invalidate()
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_index_query_count_is_constant(app, client, devices):
+    devices(5)
+    few = count_queries(app, client, '/')
+    devices(5)
+    many = count_queries(app, client, '/')
+    assert few == many
+    # Cadastro de dispositivos e últimas medições
+    assert many <= 2
@@ -0,0 +1,114 @@
+import pytest
+
+
+def test_json_reading_is_decoded():
+    from decoder import Reading, decode_reading
+
+    reading = decode_reading(
+        b'{"id_device": "decoder_test", "temp_value": 21.5, '
+        b'"humi_value": 40, "seq": 3, "ts": 1700000000}'
+    )
+    assert reading == Reading(
+        'decoder_test', 21.5, 40.0, seq=3, ts=1700000000
+    )
+    assert reading.heartbeat is False
+
+
+@pytest.mark.parametrize(
+    'payload',
+    [
+        b'',
+        b'{"id_device": "decoder_test", "temp_value": 21.5',
+        b'{"id_device": "decoder_test", "temp_value": 21.5}',
+        b'{"id_device": "", "temp_value": 21.5, "humi_value": 40}',
+        b'{"id_device": "' + b'x' * 31 + b'", "temp_value": 1, '
+        b'"humi_value": 1}',
+        b'{"id_device": "decoder_test", "temp_value": "21.5", '
+        b'"humi_value": 40}',
+        b'{"id_device": "decoder_test", "temp_value": 101, '
+        b'"humi_value": 40}',
+        b'{"id_device": "decoder_test", "temp_value": 21.5, '
+        b'"humi_value": 40, "samples": 0}',
+    ],
+)
+def test_invalid_json_reading_is_rejected(payload):
+    from decoder import DecodeError, decode_reading
+
+    with pytest.raises(DecodeError):
+        decode_reading(payload)
+
+
+def test_binary_reading_round_trip():
+    from decoder import Reading, decode_binary, encode_binary
+
+    (reading,) = decode_binary(
+        encode_binary('decoder_test', 7, 1700000000, -12.34, 56.78)
+    )
+    assert reading == Reading('decoder_test', -12.34, 56.78, 7, 1700000000)
+
+
+def test_binary_batch_round_trip():
+    from decoder import decode_binary, encode_batch
+
+    records = [(1, 1700000000, 20.0, 40.0), (2, 0, 20.5, 41.25)]
+    readings = decode_binary(encode_batch('decoder_test', records))
+    assert [
+        (r.seq, r.ts, r.temp_value, r.humi_value) for r in readings
+    ] == records
+    assert not any(reading.heartbeat for reading in readings)
+
+
+def test_binary_window_round_trip():
+    from decoder import decode_binary, encode_window
+
+    record = (3, 1700000000, 20.5, 40.0, 19.0, 22.0, 38.5, 41.5, 12)
+    (reading,) = decode_binary(encode_window('decoder_test', [record]))
+    assert (
+        reading.seq,
+        reading.ts,
+        reading.temp_value,
+        reading.humi_value,
+        reading.temp_min,
+        reading.temp_max,
+        reading.humi_min,
+        reading.humi_max,
+        reading.samples,
+    ) == record
+
+
+def test_binary_heartbeat_round_trip():
+    from decoder import decode_binary, encode_binary
+
+    (reading,) = decode_binary(
+        encode_binary('decoder_test', 8, 1700000000, 20.0, 40.0, True)
+    )
+    assert reading.heartbeat is True
+    assert (reading.seq, reading.temp_value) == (8, 20.0)
+
+
+@pytest.mark.parametrize(
+    'payload',
+    [
+        b'',
+        b'\x01',
+        # Versão desconhecida
+        b'\x09\x01a' + bytes(12),
+        # Registro incompleto e byte sobrando
+        b'\x01\x01a' + bytes(11),
+        b'\x01\x01a' + bytes(13),
+        # Id vazio e id que não é UTF-8
+        b'\x01\x00' + bytes(12),
+        b'\x01\x01\xff' + bytes(12),
+        # Lote com mais registros do que o payload contém
+        b'\x02\x01a\x02' + bytes(12),
+        # Temperatura de 200 °C
+        b'\x01\x01a' + bytes(8) + (20000).to_bytes(2, 'big') + bytes(2),
+        # Janela sem amostras
+        b'\x03\x01a\x01' + bytes(22),
+    ],
+)
+def test_invalid_binary_payload_is_rejected(payload):
+    from decoder import DecodeError, decode_binary
+
+    with pytest.raises(DecodeError):
+        decode_binary(payload)
@@ -0,0 +1,71 @@
+from datetime import datetime, UTC
+import pytest
+
+ID_DEVICE = 'test_delete'
+
+
+@pytest.fixture
+def device(app):
+    """Cria um dispositivo com medição e alarme aberto e limpa no fim."""
+    from app import db
+    from models import TbAlarms, TbDevices, TbDeviceLatest, TbHistory
+
+    with app.app_context():
+        db.session.add_all(
+            [
+                TbDevices(
+                    id_device=ID_DEVICE,
+                    temp_limit_upper=30,
+                    temp_limit_lower=10,
+                    temp_limit_setting=20,
+                    humi_limit_upper=60,
+                    humi_limit_lower=20,
+                    humi_limit_setting=40,
+                ),
+                TbDeviceLatest(
+                    id_device=ID_DEVICE,
+                    temp_value=35,
+                    humi_value=40,
+                    created_at=datetime.now(UTC),
+                ),
+                TbAlarms(
+                    id_device=ID_DEVICE,
+                    variable='temp',
+                    action='ABERTO',
+                    value=35,
+                    limit_lower=10,
+                    limit_upper=30,
+                ),
+            ]
+        )
+        db.session.commit()
+    yield ID_DEVICE
+    with app.app_context():
+        for model in (TbAlarms, TbDeviceLatest, TbHistory, TbDevices):
+            db.session.execute(
+                db.delete(model).where(model.id_device == ID_DEVICE)
+            )
+        db.session.commit()
+
+
+def test_delete_closes_alarms_and_drops_state(app, client, device):
+    from app import db
+    from ingest import writer
+    from models import TbDevices, TbDeviceLatest, open_alarms
+
+    key = (device, 'temp')
+    with app.app_context():
+        writer.alarms.seed()
+        assert key in writer.alarms._state
+
+    with client.session_transaction() as session:
+        session['user_logged'] = 'admin'
+    response = client.get(f'/delete/{device}')
+    assert response.status_code == 302
+
+    with app.app_context():
+        for model in (TbDevices, TbDeviceLatest):
+            assert db.session.get(model, device) is None
+        assert open_alarms([device]) == []
+        writer.alarms.evaluate([])
+    assert key not in writer.alarms._state
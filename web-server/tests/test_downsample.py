@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+
+def reference_lttb(x, y, threshold):
+    """LTTB ponto a ponto, como descrito por Steinarsson."""
+    every = (len(x) - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, len(x))
+        if bucket == threshold - 3:
+            avg_x, avg_y = x[-1], y[-1]
+        else:
+            avg_x = sum(x[end:next_end]) / (next_end - end)
+            avg_y = sum(y[end:next_end]) / (next_end - end)
+        areas = [
+            abs(
+                (x[a] - avg_x) * (y[i] - y[a])
+                - (x[a] - x[i]) * (avg_y - y[a])
+            )
+            for i in range(start, end)
+        ]
+        a = start + areas.index(max(areas))
+        selected.append(a)
+    return selected + [len(x) - 1]
+
+
+@pytest.mark.parametrize('size, threshold', [(1000, 100), (997, 41), (10, 3)])
+def test_lttb_keeps_endpoints_and_count(size, threshold):
+    from downsample import lttb
+
+    rng = np.random.default_rng(size)
+    x = np.arange(size, dtype=np.float64) * 20
+    y = rng.normal(25, 3, size)
+    selected = lttb(x, y, threshold)
+    assert len(selected) == threshold
+    assert (selected[0], selected[-1]) == (0, size - 1)
+    assert np.all(np.diff(selected) > 0)
+    assert selected.tolist() == reference_lttb(x, y, threshold)
+
+
+def test_lttb_keeps_a_single_spike():
+    from downsample import lttb
+
+    y = np.full(500, 25.0)
+    y[321] = 40
+    selected = lttb(np.arange(500.0), y, 20)
+    assert 321 in selected
+
+
+@pytest.mark.parametrize('threshold', [2, 50, 60])
+def test_lttb_returns_all_points_when_not_reducing(threshold):
+    from downsample import lttb
+
+    x = np.arange(50.0)
+    assert lttb(x, x, threshold).tolist() == list(range(50))
+
+
+def test_heartbeats_repeat_the_previous_reading():
+    from downsample import hold_heartbeats
+
+    values = np.array([20.0, 0.0, 0.0, 21.5, 0.0, 22.0])
+    heartbeat = np.array([False, True, True, False, True, False])
+    assert hold_heartbeats(values, heartbeat).tolist() == [
+        20.0,
+        20.0,
+        20.0,
+        21.5,
+        21.5,
+        22.0,
+    ]
+
+
+def test_heartbeat_without_previous_reading_keeps_its_value():
+    from downsample import hold_heartbeats
+
+    values = np.array([20.0, 21.0])
+    heartbeat = np.array([True, True])
+    assert hold_heartbeats(values, heartbeat).tolist() == [20.0, 20.0]
@@ -0,0 +1,130 @@
+import json
+import pytest
+
+
+def config_message(board, config):
+    """Entrega ao firmware a configuração retida no seu tópico."""
+    topic = board.mqtt._config_topic().encode()
+    board.mqtt._callback(topic, json.dumps(config).encode())
+
+
+def test_retained_config_without_changes_does_not_reset(board):
+    config_message(
+        board,
+        {'MQTT_CLIENT': 'ingest_test', 'TEMP_LIMIT_UPPER': 23.0},
+    )
+    board.mqtt._callback(board.mqtt._config_topic().encode(), b'')
+    assert board.config.TEMP_LIMIT_UPPER == 23.0
+
+
+def test_changed_config_is_saved_and_resets(firmware, board):
+    import machine
+
+    with pytest.raises(machine.Reset):
+        config_message(
+            board, {'MQTT_CLIENT': 'outro', 'TEMP_LIMIT_UPPER': 30.0}
+        )
+    assert board.config.TEMP_LIMIT_UPPER == 30.0
+    assert board.config.MQTT_CLIENT == 'ingest_test'
+    saved = firmware.Config(board.config._CONFIG_PATH)
+    assert saved.TEMP_LIMIT_UPPER == 30.0
+    # Na reconexão a mesma mensagem retida chega de novo
+    config_message(board, {'TEMP_LIMIT_UPPER': 30.0})
+
+
+def test_config_of_other_device_is_ignored(board):
+    payload = json.dumps({'TEMP_LIMIT_UPPER': 30.0}).encode()
+    board.mqtt._callback(b'sensores/config/outro', payload)
+    assert board.config.TEMP_LIMIT_UPPER == 23.0
+
+
+class RecordingI2C:
+    """Barramento I2C que guarda cada transação."""
+
+    def __init__(self, *args, **kwargs):
+        self.transactions = []
+
+    def writeto(self, addr, buf, stop=True):
+        self.transactions.append(bytes(buf))
+        return len(buf)
+
+
+def lcd_bytes(transaction):
+    """Reconstrói os bytes enviados ao LCD pelas escritas no expansor."""
+    return bytes(
+        (transaction[i + 1] & 0xF0) | (transaction[i + 3] >> 4)
+        for i in range(0, len(transaction), 4)
+    )
+
+
+@pytest.fixture
+def lcd(firmware, monkeypatch):
+    import time
+
+    monkeypatch.setattr(firmware, 'SoftI2C', RecordingI2C)
+    monkeypatch.setattr(time, 'sleep_ms', lambda ms: None, raising=False)
+    lcd = firmware.Lcd()
+    lcd._i2c.transactions.clear()
+    return lcd
+
+
+def test_lcd_sends_only_changed_cells(lcd):
+    data = dict(temp_value=21.5, humi_value=40)
+    lcd.write_data(data)
+    assert lcd._i2c.transactions
+    lcd._i2c.transactions.clear()
+
+    lcd.write_data(data)
+    assert lcd._i2c.transactions == []
+
+    lcd.write_data(dict(data, temp_value=21.7))
+    # Posiciona o cursor na coluna do dígito e envia só ele
+    move, text = lcd._i2c.transactions
+    assert lcd_bytes(move) == bytes([0x80 | 9])
+    assert lcd_bytes(text) == b'7'
+
+
+def test_lcd_write_at_matches_putchar_bytes(lcd):
+    driver = lcd._lcd
+    driver.write_at(3, 1, b'abc')
+    batched = lcd._i2c.transactions[:]
+    assert driver.cursor_x == 6
+    lcd._i2c.transactions.clear()
+
+    driver.move_to(3, 1)
+    for char in b'abc':
+        driver.hal_write_data(char)
+    assert len(batched) == 2
+    assert b''.join(batched) == b''.join(lcd._i2c.transactions)
+
+
+@pytest.mark.parametrize(
+    'message',
+    [
+        'Temp: 21.50 \xdfC  Humi: 40.00 %',
+        'Conectando\nWiFi',
+        '0123456789abcdef\nsem linha vazia',
+        '0123456789abcdefg',
+        '',
+    ],
+)
+def test_lcd_layout_wraps_like_putstr(lcd, message):
+    from lcd_api import LcdApi
+
+    class Screen(LcdApi):
+        def __init__(self):
+            self.rows = [bytearray(b' ' * 16) for _ in range(2)]
+            LcdApi.__init__(self, 2, 16)
+
+        def hal_write_command(self, cmd):
+            pass
+
+        def hal_write_data(self, data):
+            self.rows[self.cursor_y][self.cursor_x] = data
+
+        def hal_sleep_us(self, usecs):
+            pass
+
+    screen = Screen()
+    screen.putstr(message)
+    assert lcd._layout(message) == screen.rows
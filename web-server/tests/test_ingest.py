@@ -0,0 +1,112 @@
+import types
+from time import time
+import pytest
+
+
+@pytest.fixture
+def writer(app):
+    from ingest import writer
+
+    yield writer
+    while not writer._queue.empty():
+        writer._queue.get_nowait()
+    writer._drain_rejects()
+
+
+def message(payload):
+    from app import MQTT_SENSOR_BIN_TOPIC
+
+    return types.SimpleNamespace(topic=MQTT_SENSOR_BIN_TOPIC, payload=payload)
+
+
+def test_numbered_reading_with_boot_clock_is_quarantined(writer):
+    from decoder import encode_batch
+    from ingest import handle_mqtt_message
+
+    now = int(time())
+    payload = encode_batch(
+        'ingest_test', [(1, 120, 20.0, 40.0), (2, now, 21.0, 41.0)]
+    )
+    handle_mqtt_message(None, None, message(payload))
+
+    register = writer._queue.get_nowait()
+    assert writer._queue.empty()
+    assert register['seq'] == 2
+    assert register['created_at'].timestamp() == now
+    (reject,) = writer._drain_rejects()
+    assert reject['payload'] == payload
+
+
+def test_resent_reading_keeps_its_time(writer):
+    from decoder import encode_binary
+    from ingest import handle_mqtt_message
+
+    payload = encode_binary('ingest_test', 7, int(time()) - 3600, 20.0, 40.0)
+    handle_mqtt_message(None, None, message(payload))
+    handle_mqtt_message(None, None, message(payload))
+    first, second = writer._queue.get_nowait(), writer._queue.get_nowait()
+    assert first == second
+    assert writer._drain_rejects() == []
+
+
+def test_unsynced_device_is_stored_live_and_after_sync(
+    writer, firmware, board, monkeypatch
+):
+    from ingest import handle_mqtt_message
+
+    now = int(time())
+    # Relógio do dispositivo contando a partir do boot, sem NTP
+    clock = [120]
+    monkeypatch.setattr(firmware, 'time', lambda: clock[0])
+
+    def sync_time():
+        step = now - clock[0]
+        clock[0] = now
+        return step
+
+    sensor, buffer, mqtt = board.sensor, board.buffer, board.mqtt
+    device = firmware.Device(
+        board.config,
+        lcd=None,
+        sensor=sensor,
+        buffer=buffer,
+        buzzer=None,
+        wifi=types.SimpleNamespace(sync_time=sync_time),
+        mqtt_client=mqtt,
+    )
+
+    # Publicada na hora, sem horário: vale o de chegada
+    mqtt.publish_reading(sensor, buffer)
+    assert buffer.pending() == 0
+    # Sem broker, vai para o buffer com o relógio interno
+    mqtt.connected = False
+    clock[0] = 180
+    mqtt.publish_reading(sensor, buffer)
+    assert buffer.pending() == 1
+    clock[0] = 200
+    device._sync_clock()
+    mqtt.connected = True
+    mqtt.replay(buffer)
+    assert buffer.pending() == 0
+
+    for payload in board.published:
+        handle_mqtt_message(None, None, message(payload))
+    live, replayed = writer._queue.get_nowait(), writer._queue.get_nowait()
+    assert abs(live['created_at'].timestamp() - time()) < 60
+    assert replayed['created_at'].timestamp() == now - 20
+    assert (live['seq'], replayed['seq']) == (1, 2)
+    assert writer._drain_rejects() == []
+
+
+def test_buffered_heartbeat_keeps_its_flag(board):
+    from decoder import decode_binary
+
+    board.mqtt.connected = False
+    board.mqtt.publish_reading(board.sensor, board.buffer)
+    board.mqtt.publish_reading(board.sensor, board.buffer, heartbeat=True)
+    board.mqtt.connected = True
+    board.mqtt.replay(board.buffer)
+
+    (payload,) = board.published
+    readings = decode_binary(payload)
+    assert [reading.heartbeat for reading in readings] == [False, True]
@@ -0,0 +1,57 @@
+from datetime import datetime, UTC
+import pytest
+
+# Mês sem partição, longe dos criados pela manutenção
+START = datetime(2100, 1, 1, tzinfo=UTC)
+END = datetime(2100, 2, 1, tzinfo=UTC)
+PARTITION = 'tb_registers_y2100m01'
+
+
+@pytest.fixture
+def db(app):
+    from app import db
+    from models import TbRegisters, _registers_partitioned
+
+    with app.app_context():
+        if not _registers_partitioned():
+            pytest.skip('tb_registers não é particionada')
+        yield db
+        db.session.rollback()
+        db.session.execute(db.text(f'DROP TABLE IF EXISTS {PARTITION}'))
+        db.session.execute(
+            db.delete(TbRegisters).where(
+                TbRegisters.id_device == 'partition_test'
+            )
+        )
+        db.session.commit()
+
+
+def count(db, table):
+    return db.session.execute(
+        db.text(
+            f'SELECT count(*) FROM {table} '
+            "WHERE id_device = 'partition_test'"
+        )
+    ).scalar()
+
+
+def test_new_partition_takes_its_rows_from_default(db):
+    from models import TbRegisters, _create_register_partition
+
+    db.session.add_all(
+        TbRegisters(
+            id_device='partition_test',
+            temp_value=20,
+            humi_value=40,
+            created_at=created_at,
+        )
+        for created_at in (START, START.replace(day=15), END)
+    )
+    db.session.commit()
+    assert count(db, 'tb_registers_default') == 3
+
+    _create_register_partition(START, END)
+    db.session.commit()
+    assert count(db, PARTITION) == 2
+    assert count(db, 'tb_registers_default') == 1
+    assert count(db, 'tb_registers') == 3
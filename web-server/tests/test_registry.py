@@ -0,0 +1,88 @@
+import pytest
+
+
+def device(id_device, temp_limit_upper=30):
+    from devices import DeviceConfig
+
+    return DeviceConfig(id_device, temp_limit_upper, 10, 20, 60, 20, 40)
+
+
+@pytest.fixture
+def table():
+    """Cadastro lido pelo registro, com a contagem de leituras."""
+    return dict(devices=[device('a1'), device('a2')], loads=0)
+
+
+@pytest.fixture
+def make_registry(table):
+    from devices import DeviceRegistry
+
+    def make(ttl=0, during_load=None):
+        def load():
+            table['loads'] += 1
+            devices = list(table['devices'])
+            if during_load is not None:
+                during_load()
+            return devices
+
+        return DeviceRegistry(load, ttl)
+
+    return make
+
+
+def test_registry_is_read_once_until_invalidated(table, make_registry):
+    registry = make_registry()
+    assert registry.get('a1') == device('a1')
+    assert registry.get('b1') is None
+    assert [d.id_device for d in registry.all()] == ['a1', 'a2']
+    assert table['loads'] == 1
+
+    table['devices'] = [device('a1', temp_limit_upper=35)]
+    assert registry.get('a1').temp_limit_upper == 30
+    registry.invalidate('a1')
+    assert registry.get('a1').temp_limit_upper == 35
+    assert registry.get('a2') is None
+    assert table['loads'] == 2
+
+
+def test_invalidation_during_load_discards_the_result(table, make_registry):
+    invalidations = []
+
+    def invalidate_once():
+        if not invalidations:
+            invalidations.append('a1')
+            # Alteração confirmada depois da consulta começar
+            table['devices'] = [device('a1', temp_limit_upper=35)]
+            registry.invalidate('a1')
+
+    registry = make_registry(during_load=invalidate_once)
+    # A consulta em andamento ainda responde com o que leu
+    assert registry.get('a1').temp_limit_upper == 30
+    # Mas não fica guardada: a próxima relê e vê a alteração
+    assert registry.get('a1').temp_limit_upper == 35
+    assert registry.get('a1').temp_limit_upper == 35
+    assert table['loads'] == 2
+
+
+def test_registry_expires_after_ttl(table, make_registry, monkeypatch):
+    import devices
+
+    now = [1000.0]
+    monkeypatch.setattr(devices, 'monotonic', lambda: now[0])
+    registry = make_registry(ttl=60)
+    registry.get('a1')
+    now[0] += 59
+    registry.get('a1')
+    assert table['loads'] == 1
+    now[0] += 1
+    registry.get('a1')
+    assert table['loads'] == 2
+
+
+def test_invalidation_calls_the_callbacks(make_registry):
+    registry = make_registry()
+    changed = []
+    registry.on_change(changed.append)
+    registry.invalidate('a1')
+    registry.invalidate()
+    assert changed == ['a1', None]
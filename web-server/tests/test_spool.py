@@ -0,0 +1,200 @@
+import os
+import pytest
+
+
+@pytest.fixture
+def make_spool(tmp_path):
+    """Cria spools em ``tmp_path`` e libera as reservas no fim."""
+    from spool import Spool
+
+    spools = []
+
+    def make(segment_bytes=1024 * 1024):
+        spool = Spool(str(tmp_path), segment_bytes, fsync_interval=0)
+        spools.append(spool)
+        return spool
+
+    yield make
+    for spool in spools:
+        spool._lock_file.close()
+
+
+def batch(start, count):
+    return [
+        dict(id_device='spool_test', seq=seq, temp_value=20.0, humi_value=40)
+        for seq in range(start, start + count)
+    ]
+
+
+def segment_path(spool, name):
+    return os.path.join(spool.directory, name)
+
+
+def test_read_returns_batches_in_order(make_spool):
+    spool = make_spool()
+    batches = [batch(0, 3), batch(3, 2), batch(5, 4)]
+    for b in batches:
+        spool.append(b)
+    (name,) = spool.seal()
+    assert spool.read(name) == batches
+
+
+def test_read_stops_at_torn_tail(make_spool):
+    spool = make_spool()
+    spool.append(batch(0, 3))
+    spool.append(batch(3, 3))
+    (name,) = spool.seal()
+    path = segment_path(spool, name)
+    os.truncate(path, os.path.getsize(path) - 5)
+    assert spool.read(name) == [batch(0, 3)]
+
+
+def test_read_stops_at_corrupt_record(make_spool):
+    spool = make_spool()
+    for start in (0, 3, 6):
+        spool.append(batch(start, 3))
+    (name,) = spool.seal()
+    path = segment_path(spool, name)
+    with open(path, 'r+b') as f:
+        data = bytearray(f.read())
+        # Último byte do segundo registro
+        middle = len(data) * 2 // 3 - 1
+        data[middle] ^= 0xFF
+        f.seek(0)
+        f.write(data)
+    assert spool.read(name) == [batch(0, 3)]
+
+
+def test_segments_rotate_at_segment_bytes(make_spool):
+    spool = make_spool(segment_bytes=200)
+    for start in range(0, 40, 4):
+        spool.append(batch(start, 4))
+    names = spool.seal()
+    assert len(names) > 1
+    assert names == sorted(names, key=lambda name: int(name[:-4]))
+    read = [
+        register
+        for name in names
+        for b in spool.read(name)
+        for register in b
+    ]
+    assert [register['seq'] for register in read] == list(range(40))
+
+
+def test_seal_leaves_out_later_writes(make_spool):
+    spool = make_spool()
+    spool.append(batch(0, 2))
+    sealed = spool.seal()
+    spool.append(batch(2, 2))
+    assert len(sealed) == 1
+    assert len(spool.segments()) == 2
+    assert spool.seal() == spool.segments()
+
+
+def test_new_process_keeps_numbering(make_spool):
+    spool = make_spool()
+    spool.append(batch(0, 2))
+    spool.seal()
+    spool._lock_file.close()
+    other = make_spool()
+    assert other.directory == spool.directory
+    other.append(batch(2, 2))
+    assert other.seal() == ['0.wal', '1.wal']
+
+
+def test_progress_is_kept_until_the_segment_is_removed(make_spool):
+    spool = make_spool()
+    spool.append(batch(0, 2))
+    (name,) = spool.seal()
+    assert spool.progress(name) == 0
+    spool.set_progress(name, 2)
+    assert spool.progress(name) == 2
+    spool.remove(name)
+    assert spool.progress(name) == 0
+    assert os.listdir(spool.directory) == ['.lock']
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def make_writer(app):
+    """Cria writers com ``spool`` e ``flush`` substitutos.
+
+    O ``RegisterWriter`` fica no módulo de ingestão, que precisa do app.
+    """
+    from ingest import RegisterWriter
+
+    def make(spool, flush):
+        writer = RegisterWriter(
+            batch_size=10,
+            flush_interval=1,
+            queue_size=10,
+            maintenance_interval=3600,
+            live_interval=5,
+            stats_interval=60,
+            alarms=None,
+            spool_dir=None,
+            spool_segment_bytes=None,
+            spool_fsync_interval=None,
+            retry_interval=5,
+            replay_batch_size=4,
+        )
+        writer.spool = spool
+        writer._flush = flush
+        return writer
+
+    return make
+
+
+def test_replay_resumes_after_crash(make_spool, make_writer):
+    spool = make_spool()
+    for start in range(0, 10, 5):
+        spool.append(batch(start, 5))
+    written = []
+
+    def flush_then_crash(chunk, rejects=()):
+        if written:
+            raise Crash()
+        written.extend(register['seq'] for register in chunk)
+        return True
+
+    with pytest.raises(Crash):
+        make_writer(spool, flush_then_crash)._replay()
+    assert written == [0, 1, 2, 3]
+
+    # Um processo novo assume o mesmo spool
+    spool._lock_file.close()
+    spool = make_spool()
+
+    def flush(chunk, rejects=()):
+        written.extend(register['seq'] for register in chunk)
+        return True
+
+    make_writer(spool, flush)._replay()
+    assert written == list(range(10))
+    assert spool.segments() == []
+
+
+def test_replay_keeps_progress_when_the_database_fails(
+    make_spool, make_writer
+):
+    spool = make_spool()
+    spool.append(batch(0, 10))
+    written = []
+    results = iter((True, False))
+
+    def flush(chunk, rejects=()):
+        ok = next(results, True)
+        if ok:
+            written.extend(register['seq'] for register in chunk)
+        return ok
+
+    writer = make_writer(spool, flush)
+    writer._replay()
+    assert written == [0, 1, 2, 3]
+    assert spool.pending()
+    writer._replay()
+    assert written == list(range(10))
+    assert not spool.pending()
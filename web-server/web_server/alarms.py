@@ -0,0 +1,138 @@
+from datetime import timedelta
+from operator import itemgetter
+from decoder import value_range
+
+# Variável e nomes dos limites no cadastro
+VARIABLES = (
+    ('temp', 'temp_limit_lower', 'temp_limit_upper'),
+    ('humi', 'humi_limit_lower', 'humi_limit_upper'),
+)
+
+
+class AlarmEngine:
+    """Avalia as medições recebidas contra os limites de cada dispositivo.
+
+    Um alarme abre quando a variável fica fora dos limites por pelo menos
+    ``min_duration`` segundos e só fecha quando volta para dentro da faixa
+    com uma folga de ``hysteresis``. O estado fica em memória e só existe
+    para as variáveis fora da faixa: o instante em que saíram e se o alarme
+    já foi aberto. Os limites vêm do registro de dispositivos, sem consulta
+    ao banco por medição.
+
+    Nos agregados de janela enviados pelo dispositivo vale o extremo da
+    janela mais distante da faixa, para que picos curtos não passem
+    despercebidos.
+
+    O estado dos alarmes que ficaram abertos é recuperado com
+    ``open_alarms(ids_device=None)``, que os lê do banco. Quando um
+    dispositivo muda ou é removido, ``forget`` descarta o estado dele, que
+    é recuperado na próxima avaliação.
+    """
+
+    def __init__(self, registry, open_alarms, hysteresis, min_duration):
+        self.registry = registry
+        self.open_alarms = open_alarms
+        self.hysteresis = hysteresis
+        self.min_duration = timedelta(seconds=min_duration)
+        self._state = {}
+        self._seeded = False
+        self._changed = set()
+
+    def seed(self):
+        """Recupera do banco os alarmes que ficaram abertos."""
+        self._state = {
+            (alarm.id_device, alarm.variable): [alarm.created_at, True]
+            for alarm in self.open_alarms()
+        }
+        self._seeded = True
+
+    def forget(self, id_device=None):
+        """Descarta o estado de um dispositivo, ou de todos com None.
+
+        Pode ser chamado de outra thread: o estado só é alterado na próxima
+        avaliação.
+        """
+        if id_device is None:
+            self._seeded = False
+        else:
+            self._changed.add(id_device)
+
+    def _reload(self):
+        """Recupera do banco o estado dos dispositivos alterados."""
+        ids_device = set()
+        while self._changed:
+            ids_device.add(self._changed.pop())
+        self._state = {
+            key: state
+            for key, state in self._state.items()
+            if key[0] not in ids_device
+        }
+        for alarm in self.open_alarms(ids_device):
+            self._state[(alarm.id_device, alarm.variable)] = [
+                alarm.created_at,
+                True,
+            ]
+
+    def evaluate(self, batch):
+        """Retorna os eventos de abertura e fechamento gerados pelo lote."""
+        if not self._seeded:
+            self._changed.clear()
+            self.seed()
+        elif self._changed:
+            self._reload()
+        events = []
+        for register in sorted(batch, key=itemgetter('created_at')):
+            device = self.registry.get(register['id_device'])
+            if device is None:
+                continue
+            for variable, lower, upper in VARIABLES:
+                limit_lower = getattr(device, lower)
+                limit_upper = getattr(device, upper)
+                low, high = value_range(register, variable)
+                if high - limit_upper >= limit_lower - low:
+                    value = high
+                else:
+                    value = low
+                action = self._check(
+                    (register['id_device'], variable),
+                    register['created_at'],
+                    value,
+                    limit_lower,
+                    limit_upper,
+                )
+                if action is not None:
+                    events.append(
+                        dict(
+                            id_device=register['id_device'],
+                            variable=variable,
+                            action=action,
+                            value=value,
+                            limit_lower=limit_lower,
+                            limit_upper=limit_upper,
+                            created_at=register['created_at'],
+                        )
+                    )
+        return events
+
+    def _check(self, key, created_at, value, lower, upper):
+        """Atualiza o estado de um alarme e retorna a ação, se houver."""
+        state = self._state.get(key)
+        outside = value < lower or value > upper
+        if state is None:
+            if not outside:
+                return None
+            state = self._state[key] = [created_at, False]
+
+        since, is_open = state
+        if is_open:
+            if lower + self.hysteresis <= value <= upper - self.hysteresis:
+                del self._state[key]
+                return 'FECHADO'
+            return None
+        if not outside:
+            del self._state[key]
+            return None
+        if created_at - since >= self.min_duration:
+            state[1] = True
+            return 'ABERTO'
+        return None
@@ -5,11 +5,24 @@ from flask_bcrypt import Bcrypt
 from flask_mqtt import Mqtt
 from flask_socketio import SocketIO
 from os import environ
+import signal
+import sys
 
 DEBUG = bool(int(environ.get('DEBUG')))
+MQTT_INGEST = bool(int(environ.get('MQTT_INGEST', 1)))
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = environ.get('DB_URL')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+    'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', 10)),
+    'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': True,
+    'connect_args': {
+        'connect_timeout': int(environ.get('DB_CONNECT_TIMEOUT', 5))
+    },
+}
 app.config['SECRET_KEY'] = environ.get('SECRET_KEY')
 app.config['MQTT_BROKER_URL'] = environ.get('MQTT_BROKER_URL')
 app.config['MQTT_BROKER_PORT'] = int(environ.get('MQTT_BROKER_PORT'))
@@ -17,28 +30,109 @@ app.config['MQTT_USERNAME'] = ''
 app.config['MQTT_PASSWORD'] = ''
 app.config['MQTT_KEEPALIVE'] = 5
 app.config['MQTT_TLS_ENABLED'] = False
+if MQTT_INGEST:
+    app.config['MQTT_CLEAN_SESSION'] = False
+app.config['INGEST_BATCH_SIZE'] = int(environ.get('INGEST_BATCH_SIZE', 500))
+app.config['INGEST_FLUSH_INTERVAL'] = float(
+    environ.get('INGEST_FLUSH_INTERVAL', 1.0)
+)
+app.config['INGEST_QUEUE_SIZE'] = int(environ.get('INGEST_QUEUE_SIZE', 10000))
+app.config['INGEST_SPOOL_DIR'] = environ.get('INGEST_SPOOL_DIR', 'spool')
+app.config['INGEST_SPOOL_SEGMENT_BYTES'] = int(
+    environ.get('INGEST_SPOOL_SEGMENT_BYTES', 16 * 1024 * 1024)
+)
+app.config['INGEST_SPOOL_FSYNC_INTERVAL'] = float(
+    environ.get('INGEST_SPOOL_FSYNC_INTERVAL', 1.0)
+)
+app.config['INGEST_RETRY_INTERVAL'] = float(
+    environ.get('INGEST_RETRY_INTERVAL', 5)
+)
+app.config['INGEST_REPLAY_BATCH_SIZE'] = int(
+    environ.get('INGEST_REPLAY_BATCH_SIZE', 5000)
+)
+app.config['INGEST_STATS_INTERVAL'] = float(
+    environ.get('INGEST_STATS_INTERVAL', 60)
+)
+app.config['REGISTERS_PARTITION_MONTHS_AHEAD'] = int(
+    environ.get('REGISTERS_PARTITION_MONTHS_AHEAD', 3)
+)
+app.config['REGISTERS_RETENTION_MONTHS'] = int(
+    environ.get('REGISTERS_RETENTION_MONTHS', 0)
+)
+app.config['REGISTERS_PAGE_SIZE'] = int(
+    environ.get('REGISTERS_PAGE_SIZE', 100)
+)
+app.config['LIVE_EMIT_INTERVAL'] = float(
+    environ.get('LIVE_EMIT_INTERVAL', 5)
+)
+app.config['EXPORT_CHUNK_SIZE'] = int(environ.get('EXPORT_CHUNK_SIZE', 5000))
+app.config['SERIES_RAW_PERIOD'] = float(environ.get('SERIES_RAW_PERIOD', 20))
+app.config['SERIES_MAX_ROWS'] = int(environ.get('SERIES_MAX_ROWS', 20000))
+app.config['SERIES_MAX_POINTS'] = int(environ.get('SERIES_MAX_POINTS', 5000))
+app.config['REGISTERS_MAINTENANCE_INTERVAL'] = float(
+    environ.get('REGISTERS_MAINTENANCE_INTERVAL', 3600)
+)
+app.config['INGEST_MAX_CLOCK_SKEW'] = float(
+    environ.get('INGEST_MAX_CLOCK_SKEW', 300)
+)
+app.config['DEVICE_REGISTRY_TTL'] = float(
+    environ.get('DEVICE_REGISTRY_TTL', 0)
+)
+app.config['ALARM_HYSTERESIS'] = float(environ.get('ALARM_HYSTERESIS', 0.5))
+app.config['ALARM_MIN_DURATION'] = float(
+    environ.get('ALARM_MIN_DURATION', 60)
+)
 
 
 MQTT_SENSOR_TOPIC = 'sensores/medidas'
+MQTT_SENSOR_BIN_TOPIC = 'sensores/v1/medidas'
 MQTT_CONFIG_TOPIC = 'sensores/config'
+MQTT_SHARE_GROUP = environ.get('MQTT_SHARE_GROUP', 'ingest')
 
-socketio = SocketIO(app)
+# O Gunicorn usa workers gevent; o servidor de desenvolvimento e o
+# worker.py, threads
+socketio = SocketIO(
+    app,
+    message_queue=environ.get('SOCKETIO_MESSAGE_QUEUE') or None,
+    async_mode=environ.get('SOCKETIO_ASYNC_MODE', 'threading'),
+)
 db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
-mqtt = Mqtt(app, connect_async=True)
+# Conectado no fim do módulo, depois que o processo de ingestão reserva o
+# seu spool
+mqtt = Mqtt(connect_async=True)
 
 
 @mqtt.on_connect()
 def handle_connect(client, userdata, flags, rc):
-    mqtt.subscribe(MQTT_SENSOR_TOPIC)
+    if MQTT_INGEST:
+        for topic in (MQTT_SENSOR_TOPIC, MQTT_SENSOR_BIN_TOPIC):
+            if MQTT_SHARE_GROUP:
+                topic = f'$share/{MQTT_SHARE_GROUP}/{topic}'
+            mqtt.subscribe(topic, qos=1)
 
 
 from views_device import *
 from views_user import *
 
 from models import create_database
+from registry import listener
+from ingest import writer
 
 create_database()
+listener.start()
+if MQTT_INGEST:
+    writer.start()
+    # O subdiretório do spool identifica a réplica: quem o assume depois de
+    # um reinício retoma a sessão persistente, e as medições guardadas pelo
+    # broker, de quem o usava.
+    app.config['MQTT_CLIENT_ID'] = (
+        environ.get('MQTT_CLIENT_ID') or f'ingest-{writer.spool.slot}'
+    )
+mqtt.init_app(app)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=DEBUG)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    socketio.run(
+        app, host='0.0.0.0', debug=DEBUG, allow_unsafe_werkzeug=True
+    )
@@ -0,0 +1,248 @@
+"""Decodificação e validação das medições recebidas via MQTT.
+
+As medições chegam em dois formatos:
+
+- JSON, no tópico ``sensores/medidas``: ``{"id_device": ..., "temp_value":
+  ..., "humi_value": ...}``.
+- Binário versão 1, no tópico ``sensores/v1/medidas``, em big-endian:
+  versão (``B``), tamanho do id (``B``), id em UTF-8, número de sequência
+  (``I``), instante Unix da medição em segundos (``I``, 0 se o relógio do
+  dispositivo não estiver sincronizado) e temperatura e umidade em
+  centésimos (``h``).
+- Binário versão 2, no mesmo tópico: lote de medições guardadas pelo
+  dispositivo enquanto estava sem conexão. Depois do id vem a quantidade
+  de registros (``B``), seguida dos registros no mesmo formato da versão 1.
+- Binário versão 3, no mesmo tópico: lote de agregados de janela, com o
+  mesmo cabeçalho da versão 2. Cada registro traz sequência (``I``),
+  instante do fim da janela (``I``), médias de temperatura e umidade,
+  mínimo e máximo da temperatura, mínimo e máximo da umidade (``h``, em
+  centésimos) e a quantidade de amostras (``H``).
+- Binário versão 4, no mesmo tópico: heartbeat, com o mesmo formato da
+  versão 1. O dispositivo publica por exceção e envia um heartbeat quando
+  passa muito tempo sem variação significativa; no JSON, o heartbeat vem
+  com ``"heartbeat": true``.
+- Binário versão 5, no mesmo tópico: lote de medições guardadas, como a
+  versão 2, com um byte de marcas (``B``) ao fim de cada registro; o bit
+  0 indica heartbeat.
+
+Nos agregados, ``temp_value`` e ``humi_value`` são as médias da janela.
+"""
+import struct
+from typing import Annotated, Optional
+import msgspec
+
+MAX_DEVICE_ID = 30
+MIN_VALUE, MAX_VALUE = -100, 100
+
+DeviceId = Annotated[str, msgspec.Meta(min_length=1, max_length=MAX_DEVICE_ID)]
+Value = Annotated[float, msgspec.Meta(ge=MIN_VALUE, le=MAX_VALUE)]
+Samples = Annotated[int, msgspec.Meta(ge=1)]
+
+BINARY_VERSION = 1
+BATCH_VERSION = 2
+WINDOW_VERSION = 3
+HEARTBEAT_VERSION = 4
+FLAGGED_BATCH_VERSION = 5
+FLAG_HEARTBEAT = 0x01
+_HEADER = struct.Struct('!BB')
+_COUNT = struct.Struct('!B')
+_RECORD = struct.Struct('!IIhh')
+_WINDOW = struct.Struct('!IIhhhhhhH')
+_FLAGGED_RECORD = struct.Struct('!IIhhB')
+_RECORDS = {
+    WINDOW_VERSION: _WINDOW,
+    FLAGGED_BATCH_VERSION: _FLAGGED_RECORD,
+}
+_BATCHES = (BATCH_VERSION, WINDOW_VERSION, FLAGGED_BATCH_VERSION)
+
+
+class Reading(msgspec.Struct):
+    id_device: DeviceId
+    temp_value: Value
+    humi_value: Value
+    seq: Optional[int] = None
+    ts: Optional[int] = None
+    temp_min: Optional[Value] = None
+    temp_max: Optional[Value] = None
+    humi_min: Optional[Value] = None
+    humi_max: Optional[Value] = None
+    samples: Optional[Samples] = None
+    heartbeat: bool = False
+
+
+class DecodeError(ValueError):
+    pass
+
+
+_json_decoder = msgspec.json.Decoder(Reading)
+
+
+def decode_reading(payload):
+    """Converte o payload JSON de uma medição em um ``Reading`` validado."""
+    try:
+        return _json_decoder.decode(payload)
+    except msgspec.DecodeError as error:
+        raise DecodeError(str(error)) from None
+
+
+def decode_binary(payload):
+    """Converte o payload binário em uma lista de ``Reading``.
+
+    A versão 1 traz uma medição, a versão 2 um lote delas, a versão 3 um
+    lote de agregados de janela, a versão 4 um heartbeat e a versão 5 um
+    lote de medições com marcas. Um registro inválido rejeita o lote
+    inteiro.
+    """
+    try:
+        version, size = _HEADER.unpack_from(payload)
+        offset = _HEADER.size + size
+        record = _RECORDS.get(version, _RECORD)
+        if version in (BINARY_VERSION, HEARTBEAT_VERSION):
+            count = 1
+        elif version in _BATCHES:
+            (count,) = _COUNT.unpack_from(payload, offset)
+            offset += _COUNT.size
+        else:
+            raise DecodeError(f'Versão {version} não suportada')
+        if len(payload) != offset + count * record.size:
+            raise DecodeError(f'Tamanho inválido: {len(payload)} bytes')
+        id_device = bytes(payload[_HEADER.size:_HEADER.size + size]).decode()
+        records = list(record.iter_unpack(payload[offset:]))
+    except (struct.error, UnicodeDecodeError) as error:
+        raise DecodeError(str(error)) from None
+    if not 1 <= size <= MAX_DEVICE_ID:
+        raise DecodeError(f'Id do dispositivo com {size} bytes')
+    if version == WINDOW_VERSION:
+        return [_window_reading(id_device, fields) for fields in records]
+    readings = []
+    for seq, ts, temp, humi, *flags in records:
+        temp_value, humi_value = temp / 100, humi / 100
+        if not (
+            MIN_VALUE <= temp_value <= MAX_VALUE
+            and MIN_VALUE <= humi_value <= MAX_VALUE
+        ):
+            raise DecodeError(
+                f'Valores fora da faixa: {temp_value}, {humi_value}'
+            )
+        if flags:
+            heartbeat = bool(flags[0] & FLAG_HEARTBEAT)
+        else:
+            heartbeat = version == HEARTBEAT_VERSION
+        readings.append(
+            Reading(
+                id_device,
+                temp_value,
+                humi_value,
+                seq,
+                ts,
+                heartbeat=heartbeat,
+            )
+        )
+    return readings
+
+
+def _window_reading(id_device, fields):
+    seq, ts, *values, samples = fields
+    values = [value / 100 for value in values]
+    temp_value, humi_value, temp_min, temp_max, humi_min, humi_max = values
+    if not all(MIN_VALUE <= value <= MAX_VALUE for value in values):
+        raise DecodeError(f'Valores fora da faixa: {values}')
+    if not samples:
+        raise DecodeError('Janela sem amostras')
+    return Reading(
+        id_device,
+        temp_value,
+        humi_value,
+        seq,
+        ts,
+        temp_min=temp_min,
+        temp_max=temp_max,
+        humi_min=humi_min,
+        humi_max=humi_max,
+        samples=samples,
+    )
+
+
+def value_range(register, variable):
+    """Retorna o mínimo e o máximo de ``variable`` (``temp`` ou ``humi``).
+
+    Para um agregado de janela do dispositivo são os extremos da janela;
+    para uma medição simples, o próprio valor.
+    """
+    low = register.get(f'{variable}_min')
+    if low is None:
+        value = register[f'{variable}_value']
+        return value, value
+    return low, register[f'{variable}_max']
+
+
+def encode_binary(
+    id_device, seq, ts, temp_value, humi_value, heartbeat=False
+):
+    """Gera o payload binário de uma medição, como o firmware."""
+    id_bytes = id_device.encode()
+    version = HEARTBEAT_VERSION if heartbeat else BINARY_VERSION
+    return (
+        _HEADER.pack(version, len(id_bytes))
+        + id_bytes
+        + _RECORD.pack(
+            seq, ts, round(temp_value * 100), round(humi_value * 100)
+        )
+    )
+
+
+def encode_batch(id_device, records):
+    """Gera o payload de um lote, com registros ``(seq, ts, temp, humi)``."""
+    id_bytes = id_device.encode()
+    return (
+        _HEADER.pack(BATCH_VERSION, len(id_bytes))
+        + id_bytes
+        + _COUNT.pack(len(records))
+        + b''.join(
+            _RECORD.pack(seq, ts, round(temp * 100), round(humi * 100))
+            for seq, ts, temp, humi in records
+        )
+    )
+
+
+def encode_flagged_batch(id_device, records):
+    """Gera o payload de um lote com marcas, como o firmware.
+
+    Cada registro é ``(seq, ts, temp, humi, heartbeat)``.
+    """
+    id_bytes = id_device.encode()
+    return (
+        _HEADER.pack(FLAGGED_BATCH_VERSION, len(id_bytes))
+        + id_bytes
+        + _COUNT.pack(len(records))
+        + b''.join(
+            _FLAGGED_RECORD.pack(
+                seq,
+                ts,
+                round(temp * 100),
+                round(humi * 100),
+                FLAG_HEARTBEAT if heartbeat else 0,
+            )
+            for seq, ts, temp, humi, heartbeat in records
+        )
+    )
+
+
+def encode_window(id_device, records):
+    """Gera o payload de um lote de agregados, como o firmware.
+
+    Cada registro é ``(seq, ts, temp_mean, humi_mean, temp_min, temp_max,
+    humi_min, humi_max, samples)``.
+    """
+    id_bytes = id_device.encode()
+    return (
+        _HEADER.pack(WINDOW_VERSION, len(id_bytes))
+        + id_bytes
+        + _COUNT.pack(len(records))
+        + b''.join(
+            _WINDOW.pack(
+                seq, ts, *(round(value * 100) for value in values), samples
+            )
+            for seq, ts, *values, samples in records
+        )
+    )
@@ -0,0 +1,80 @@
+import threading
+from collections import namedtuple
+from time import monotonic
+
+DeviceConfig = namedtuple(
+    'DeviceConfig',
+    (
+        'id_device',
+        'temp_limit_upper',
+        'temp_limit_lower',
+        'temp_limit_setting',
+        'humi_limit_upper',
+        'humi_limit_lower',
+        'humi_limit_setting',
+    ),
+)
+
+
+class DeviceRegistry:
+    """Cópia em memória do cadastro de dispositivos.
+
+    O cadastro é lido inteiro por ``load()``, que retorna os
+    ``DeviceConfig`` ordenados pelo id, na primeira consulta e mantido até
+    ser invalidado, seja pelas rotas de cadastro deste processo, seja por
+    uma notificação do Postgres vinda de outro processo. Se ``ttl`` for
+    maior que zero, a cópia também expira depois de ``ttl`` segundos.
+
+    Quem guarda estado por dispositivo se registra em ``on_change`` para
+    ser avisado das invalidações.
+    """
+
+    def __init__(self, load, ttl):
+        self.load = load
+        self.ttl = ttl
+        self._devices = None
+        self._loaded_at = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def on_change(self, callback):
+        """Registra ``callback(id_device)``, chamado a cada invalidação.
+
+        ``id_device`` é None quando qualquer dispositivo pode ter mudado.
+        """
+        self._callbacks.append(callback)
+
+    def invalidate(self, id_device=None):
+        with self._lock:
+            self._generation += 1
+            self._devices = None
+        for callback in self._callbacks:
+            callback(id_device)
+
+    def _load(self):
+        with self._lock:
+            generation = self._generation
+        devices = {device.id_device: device for device in self.load()}
+        with self._lock:
+            # Uma invalidação durante a leitura descarta o resultado, que
+            # pode não conter a alteração que a causou.
+            if generation == self._generation:
+                self._devices = devices
+                self._loaded_at = monotonic()
+        return devices
+
+    def _fresh(self):
+        devices = self._devices
+        if devices is None or (
+            self.ttl > 0 and monotonic() - self._loaded_at >= self.ttl
+        ):
+            devices = self._load()
+        return devices
+
+    def get(self, id_device):
+        return self._fresh().get(id_device)
+
+    def all(self):
+        """Retorna todos os dispositivos, ordenados pelo id."""
+        return list(self._fresh().values())
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """Seleciona ``threshold`` pontos com Largest-Triangle-Three-Buckets.
+
+    Retorna os índices dos pontos escolhidos. As médias dos buckets vêm de
+    somas acumuladas e a área dos triângulos de cada bucket é calculada de
+    uma vez; só a escolha do ponto de cada bucket, que depende do ponto
+    escolhido no bucket anterior, fica no laço.
+    """
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts
+    mean_x = (sum_x[ends] - sum_x[starts]) / counts
+    mean_y = (sum_y[ends] - sum_y[starts]) / counts
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = starts[bucket], ends[bucket]
+        area = np.abs(
+            (x[a] - next_x[bucket]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y[bucket] - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return selected
+
+
+def hold_heartbeats(values, heartbeat):
+    """Repete nos heartbeats o valor da medição anterior.
+
+    Um heartbeat indica que o valor não variou além da banda morta do
+    dispositivo, então a série fica constante até a próxima variação.
+    """
+    index = np.where(heartbeat, 0, np.arange(len(values)))
+    return values[np.maximum.accumulate(index)]
@@ -0,0 +1,110 @@
+import csv
+import io
+from app import app, db
+from models import TbRegisters
+
+COLUMNS = (
+    TbRegisters.id,
+    TbRegisters.id_device,
+    TbRegisters.temp_value,
+    TbRegisters.humi_value,
+    TbRegisters.created_at,
+    TbRegisters.temp_min,
+    TbRegisters.temp_max,
+    TbRegisters.humi_min,
+    TbRegisters.humi_max,
+    TbRegisters.samples,
+    TbRegisters.heartbeat,
+)
+
+
+def _chunks(query):
+    """Percorre a consulta com um cursor no servidor, em blocos fixos."""
+    stmt = (
+        query.with_entities(*COLUMNS)
+        .order_by(TbRegisters.created_at, TbRegisters.id)
+        .statement.execution_options(
+            yield_per=app.config['EXPORT_CHUNK_SIZE']
+        )
+    )
+    yield from db.session.execute(stmt).partitions()
+
+
+def export_csv(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in COLUMNS])
+    for chunk in _chunks(query):
+        for row in chunk:
+            writer.writerow(
+                [
+                    row.id,
+                    row.id_device,
+                    row.temp_value,
+                    row.humi_value,
+                    row.created_at.isoformat(),
+                    row.temp_min,
+                    row.temp_max,
+                    row.humi_min,
+                    row.humi_max,
+                    row.samples,
+                    row.heartbeat,
+                ]
+            )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _Sink(io.RawIOBase):
+    """Arquivo somente de escrita que entrega o que foi escrito em partes."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_parquet(query):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ('id', pa.int64()),
+            ('id_device', pa.string()),
+            ('temp_value', pa.float64()),
+            ('humi_value', pa.float64()),
+            ('created_at', pa.timestamp('us', tz='UTC')),
+            ('temp_min', pa.float64()),
+            ('temp_max', pa.float64()),
+            ('humi_min', pa.float64()),
+            ('humi_max', pa.float64()),
+            ('samples', pa.int32()),
+            ('heartbeat', pa.bool_()),
+        ]
+    )
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in _chunks(query):
+            writer.write_table(
+                pa.Table.from_pylist([row._asdict() for row in chunk], schema)
+            )
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,50 @@
+"""Configuração do Gunicorn para o servidor web em produção.
+
+Cada worker é um processo com o worker ``gevent``: cada conexão é uma
+greenlet, então um painel conectado por WebSocket não prende uma thread e
+um worker atende até ``WEB_CONNECTIONS`` conexões simultâneas. O
+Flask-SocketIO roda no modo ``gevent``, com o pacote simple-websocket, e o
+psycopg2 passa a ceder a vez durante as consultas (psycogreen). O painel
+usa somente o transporte WebSocket, então não é preciso afinidade de
+sessão entre workers, e as mensagens entre processos passam pela fila
+definida em ``SOCKETIO_MESSAGE_QUEUE``. Sob o Gunicorn, ``MQTT_INGEST``
+é 0 por padrão.
+"""
+from multiprocessing import cpu_count
+from os import environ
+
+# A ingestão roda em um processo próprio (worker.py). Com ela ligada, cada
+# worker do Gunicorn assinaria as medições e gravaria as mesmas mensagens.
+environ.setdefault('MQTT_INGEST', '0')
+environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent')
+
+bind = f"0.0.0.0:{environ.get('WEB_PORT', 5000)}"
+worker_class = 'gevent'
+workers = int(environ.get('WEB_WORKERS', cpu_count()))
+if int(environ['MQTT_INGEST']) and workers > 1:
+    raise SystemExit(
+        'MQTT_INGEST=1 com mais de um worker do Gunicorn: use o worker.py '
+        'para a ingestão ou WEB_WORKERS=1'
+    )
+worker_connections = int(environ.get('WEB_CONNECTIONS', 1000))
+# Sob o gevent, uma requisição à espera de uma conexão livre do pool pode
+# ser passada para trás seguidamente por outras, então o pool de cada
+# worker deve cobrir as requisições simultâneas. Por padrão, as
+# WEB_DB_CONNECTIONS conexões são divididas entre os workers.
+connections = int(environ.get('WEB_DB_CONNECTIONS', 80)) // workers
+environ.setdefault('DB_POOL_SIZE', str(min(connections, 10)))
+environ.setdefault('DB_MAX_OVERFLOW', str(max(connections - 10, 0)))
+timeout = int(environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+max_requests = 10000
+max_requests_jitter = 1000
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    # Sem isso, cada consulta ao banco bloquearia todas as conexões do
+    # worker até terminar
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
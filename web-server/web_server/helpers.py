@@ -1,12 +1,16 @@
 import os
 from app import app
 from flask_wtf import FlaskForm
+from sqlalchemy import tuple_
+from pytz import timezone
+from datetime import datetime
 from wtforms import (
     StringField,
     FloatField,
     SubmitField,
     PasswordField,
     IntegerField,
+    DateTimeLocalField,
     validators,
 )
 
@@ -49,3 +53,62 @@ class FormUser(FlaskForm):
         [validators.DataRequired(), validators.Length(min=1, max=100)],
     )
     login = SubmitField('Login')
+
+
+class FormFilter(FlaskForm):
+    class Meta:
+        csrf = False
+
+    id_device = StringField(
+        'ID_Dispositivo', [validators.Optional(), validators.Length(max=30)]
+    )
+    start = DateTimeLocalField(
+        'Início', [validators.Optional()], format='%Y-%m-%dT%H:%M'
+    )
+    end = DateTimeLocalField(
+        'Fim', [validators.Optional()], format='%Y-%m-%dT%H:%M'
+    )
+
+    search = SubmitField('Filtrar')
+
+
+def filter_query(query, model, form):
+    local = timezone('America/Manaus')
+    if form.id_device.data:
+        query = query.filter(model.id_device == form.id_device.data)
+    if form.start.data:
+        query = query.filter(
+            model.created_at >= local.localize(form.start.data)
+        )
+    if form.end.data:
+        query = query.filter(
+            model.created_at < local.localize(form.end.data)
+        )
+    return query
+
+
+def paginate(query, model, cursor, page_size):
+    """Retorna uma página ordenada da mais recente para a mais antiga.
+
+    A paginação é feita por keyset sobre ``(created_at, id)``: o cursor é a
+    chave da última linha da página anterior, então cada página é uma busca
+    limitada no índice, independente de quantas páginas já foram vistas.
+    """
+    if cursor:
+        try:
+            created_at, id = cursor.rsplit('_', 1)
+            key = (datetime.fromisoformat(created_at), int(id))
+        except ValueError:
+            key = None
+        if key:
+            query = query.filter(tuple_(model.created_at, model.id) < key)
+    rows = (
+        query.order_by(model.created_at.desc(), model.id.desc())
+        .limit(page_size + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = f'{rows[-1].created_at.isoformat()}_{rows[-1].id}'
+    return rows, next_cursor
@@ -0,0 +1,437 @@
+import atexit
+import queue
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, UTC
+from time import monotonic
+from sqlalchemy import insert, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app import app, db, mqtt, MQTT_SENSOR_TOPIC, MQTT_SENSOR_BIN_TOPIC
+from models import (
+    TbRegisters,
+    TbDeviceLatest,
+    TbQuarantine,
+    TbAlarms,
+    ensure_register_partitions,
+    open_alarms,
+    drop_expired_register_partitions,
+)
+from rollups import update_rollups
+from live import LiveUpdates
+from registry import registry
+from alarms import AlarmEngine
+from spool import Spool
+from decoder import DecodeError, decode_reading, decode_binary
+
+
+def decode_json(payload):
+    return [decode_reading(payload)]
+
+
+# Cada decodificador retorna a lista de medições contidas no payload.
+DECODERS = {
+    MQTT_SENSOR_TOPIC: decode_json,
+    MQTT_SENSOR_BIN_TOPIC: decode_binary,
+}
+# Campos que só existem em parte das medições (sequência, agregados e
+# heartbeat)
+OPTIONAL_FIELDS = (
+    'seq',
+    'temp_min',
+    'temp_max',
+    'humi_min',
+    'humi_max',
+    'samples',
+    'heartbeat',
+)
+# Medições já gravadas, reenviadas pelo dispositivo, são ignoradas.
+INSERT_REGISTERS = (
+    pg_insert(TbRegisters)
+    .on_conflict_do_nothing(
+        index_elements=['id_device', 'seq', 'created_at']
+    )
+    .returning(
+        TbRegisters.id_device,
+        TbRegisters.temp_value,
+        TbRegisters.humi_value,
+        TbRegisters.created_at,
+        *(getattr(TbRegisters, field) for field in OPTIONAL_FIELDS),
+    )
+)
+# Instantes anteriores a 2020 indicam relógio do dispositivo sem NTP.
+MIN_DEVICE_TIME = datetime(2020, 1, 1, tzinfo=UTC)
+
+
+class RegisterWriter:
+    """Grava as medições recebidas via MQTT em lotes, fora da thread do MQTT.
+
+    As medições são enfileiradas em uma fila limitada e uma thread dedicada
+    as insere em ``tb_registers`` com um único INSERT de múltiplas linhas
+    sempre que o lote atinge ``batch_size`` ou quando ``flush_interval``
+    segundos se passam desde a última gravação.
+
+    Se o banco falhar ou a fila encher, as medições vão para o spool em
+    disco. Enquanto houver dados no spool, os lotes novos também vão para
+    ele, preservando a ordem, e a cada ``retry_interval`` segundos o spool
+    é reprocessado em lotes de ``replay_batch_size``.
+    """
+
+    def __init__(
+        self,
+        batch_size,
+        flush_interval,
+        queue_size,
+        maintenance_interval,
+        live_interval,
+        stats_interval,
+        alarms,
+        spool_dir,
+        spool_segment_bytes,
+        spool_fsync_interval,
+        retry_interval,
+        replay_batch_size,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.maintenance_interval = maintenance_interval
+        self.stats_interval = stats_interval
+        self.stats = Counter()
+        self.live = LiveUpdates(live_interval)
+        self.alarms = alarms
+        self.spool_dir = spool_dir
+        self.spool_segment_bytes = spool_segment_bytes
+        self.spool_fsync_interval = spool_fsync_interval
+        self.retry_interval = retry_interval
+        self.replay_batch_size = replay_batch_size
+        self.spool = None
+        self.replay_rate = 0.0
+        self._retry_at = 0.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._rejects = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.spool = Spool(
+            self.spool_dir,
+            self.spool_segment_bytes,
+            self.spool_fsync_interval,
+        )
+        self._thread = threading.Thread(
+            target=self._run, name='register-writer', daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Esvazia a fila, grava o que restar e encerra a thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def put(self, register):
+        """Enfileira sem bloquear; se a fila estiver cheia, usa o spool."""
+        try:
+            self._queue.put_nowait(register)
+            self.stats['accepted'] += 1
+            return True
+        except queue.Full:
+            return self._spool([register])
+
+    def _spool(self, batch):
+        if self.spool is not None:
+            try:
+                self.spool.append(batch)
+                self.stats['spooled'] += len(batch)
+                return True
+            except OSError:
+                app.logger.exception('Falha ao gravar no spool')
+        self.stats['dropped'] += len(batch)
+        app.logger.warning(
+            '%d medições descartadas (%d no total)',
+            len(batch),
+            self.stats['dropped'],
+        )
+        return False
+
+    def reject(self, topic, payload, error):
+        """Envia uma mensagem inválida para a quarentena."""
+        self.stats['rejected'] += 1
+        try:
+            self._rejects.put_nowait(
+                dict(
+                    topic=topic,
+                    payload=bytes(payload),
+                    error=error,
+                    created_at=datetime.now(UTC),
+                )
+            )
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def _drain_rejects(self):
+        rejects = []
+        while True:
+            try:
+                rejects.append(self._rejects.get_nowait())
+            except queue.Empty:
+                return rejects
+
+    def _run(self):
+        batch = []
+        deadline = monotonic() + self.flush_interval
+        maintenance_at = monotonic() + self.maintenance_interval
+        stats_at = monotonic() + self.stats_interval
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                batch.append(
+                    self._queue.get(timeout=max(deadline - monotonic(), 0))
+                )
+            except queue.Empty:
+                pass
+            if len(batch) >= self.batch_size or monotonic() >= deadline:
+                self._write(batch, self._drain_rejects())
+                batch = []
+                deadline = monotonic() + self.flush_interval
+            self.live.emit_due()
+            if monotonic() >= maintenance_at:
+                self._maintain()
+                maintenance_at = monotonic() + self.maintenance_interval
+            if monotonic() >= stats_at:
+                self._log_stats()
+                stats_at = monotonic() + self.stats_interval
+        self._write(batch, self._drain_rejects())
+        self.spool.seal()
+
+    def _write(self, batch, rejects):
+        """Grava o lote no banco ou, se ele estiver indisponível, no spool."""
+        if monotonic() >= self._retry_at and self.spool.pending():
+            self._replay()
+        if monotonic() >= self._retry_at and not self.spool.pending():
+            if not (batch or rejects) or self._flush(batch, rejects):
+                return
+            self._retry_at = monotonic() + self.retry_interval
+        if batch:
+            self._spool(batch)
+        if rejects:
+            self.stats['dropped'] += len(rejects)
+
+    def _replay(self):
+        """Regrava no banco o conteúdo do spool, do segmento mais antigo."""
+        started = monotonic()
+        replayed = 0
+        for name in self.spool.seal():
+            registers = [
+                register
+                for batch in self.spool.read(name)
+                for register in batch
+            ]
+            for register in registers:
+                # Segmentos de versões anteriores não trazem esses campos.
+                for field in OPTIONAL_FIELDS:
+                    register.setdefault(field, None)
+            # Medições sem seq não são descartadas pelo índice único, então
+            # o progresso é guardado a cada lote confirmado. Uma queda entre
+            # o commit e a gravação do progresso regrava só aquele lote.
+            for start in range(
+                self.spool.progress(name),
+                len(registers),
+                self.replay_batch_size,
+            ):
+                chunk = registers[start:start + self.replay_batch_size]
+                if not self._flush(chunk):
+                    self._retry_at = monotonic() + self.retry_interval
+                    break
+                self.spool.set_progress(name, start + len(chunk))
+                replayed += len(chunk)
+            else:
+                self.spool.remove(name)
+                continue
+            break
+        if replayed:
+            elapsed = max(monotonic() - started, 1e-6)
+            self.replay_rate = replayed / elapsed
+            self.stats['replayed'] += replayed
+            app.logger.info(
+                'Spool: %d medições regravadas em %.1f s (%.0f/s)',
+                replayed,
+                elapsed,
+                self.replay_rate,
+            )
+
+    def _flush(self, batch, rejects=()):
+        latest = events = inserted = ()
+        try:
+            with app.app_context():
+                if batch:
+                    inserted = [
+                        row._asdict()
+                        for row in db.session.execute(
+                            INSERT_REGISTERS, batch
+                        )
+                    ]
+                if inserted:
+                    latest = self._update_latest(inserted)
+                    update_rollups(inserted)
+                    events = self.alarms.evaluate(inserted)
+                    if events:
+                        db.session.execute(insert(TbAlarms), events)
+                if rejects:
+                    db.session.execute(insert(TbQuarantine), rejects)
+                db.session.commit()
+        except Exception:
+            app.logger.exception(
+                'Falha ao gravar lote de %d medições', len(batch)
+            )
+            return False
+        self.stats['written'] += len(inserted)
+        self.stats['duplicates'] += len(batch) - len(inserted)
+        self.stats['quarantined'] += len(rejects)
+        self.stats['alarms'] += len(events)
+        self.live.push(latest)
+        self.live.alarms(events)
+        return True
+
+    def _log_stats(self):
+        segments, size = self.spool.depth()
+        app.logger.info(
+            'Ingestão: %s, fila com %d medições, spool com %d segmentos '
+            '(%d bytes), último reprocessamento a %.0f medições/s',
+            ', '.join(f'{key}={value}' for key, value in self.stats.items()),
+            self._queue.qsize(),
+            segments,
+            size,
+            self.replay_rate,
+        )
+
+    def _maintain(self):
+        try:
+            with app.app_context():
+                ensure_register_partitions()
+                drop_expired_register_partitions()
+        except Exception:
+            app.logger.exception('Falha na manutenção das partições')
+
+    def _update_latest(self, batch):
+        latest = {}
+        for register in batch:
+            current = latest.get(register['id_device'])
+            if (
+                current is None
+                or register['created_at'] >= current['created_at']
+            ):
+                latest[register['id_device']] = register
+
+        stmt = pg_insert(TbDeviceLatest)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TbDeviceLatest.id_device],
+            set_={
+                'temp_value': stmt.excluded.temp_value,
+                'humi_value': stmt.excluded.humi_value,
+                'created_at': stmt.excluded.created_at,
+                'updated_at': func.now(),
+            },
+            where=TbDeviceLatest.created_at <= stmt.excluded.created_at,
+        )
+        db.session.execute(
+            stmt,
+            [
+                dict(
+                    id_device=register['id_device'],
+                    temp_value=register['temp_value'],
+                    humi_value=register['humi_value'],
+                    created_at=register['created_at'],
+                )
+                for register in latest.values()
+            ],
+        )
+        return latest.values()
+
+
+writer = RegisterWriter(
+    batch_size=app.config['INGEST_BATCH_SIZE'],
+    flush_interval=app.config['INGEST_FLUSH_INTERVAL'],
+    queue_size=app.config['INGEST_QUEUE_SIZE'],
+    maintenance_interval=app.config['REGISTERS_MAINTENANCE_INTERVAL'],
+    live_interval=app.config['LIVE_EMIT_INTERVAL'],
+    stats_interval=app.config['INGEST_STATS_INTERVAL'],
+    alarms=AlarmEngine(
+        registry,
+        open_alarms,
+        hysteresis=app.config['ALARM_HYSTERESIS'],
+        min_duration=app.config['ALARM_MIN_DURATION'],
+    ),
+    spool_dir=app.config['INGEST_SPOOL_DIR'],
+    spool_segment_bytes=app.config['INGEST_SPOOL_SEGMENT_BYTES'],
+    spool_fsync_interval=app.config['INGEST_SPOOL_FSYNC_INTERVAL'],
+    retry_interval=app.config['INGEST_RETRY_INTERVAL'],
+    replay_batch_size=app.config['INGEST_REPLAY_BATCH_SIZE'],
+)
+registry.on_change(writer.alarms.forget)
+
+
+def reading_time(reading, received_at):
+    """Usa o instante informado pelo dispositivo, se for plausível.
+
+    Sem instante (ausente ou 0, que o dispositivo sem NTP envia nas
+    medições publicadas na hora), vale o de recebimento. Uma medição
+    numerada com instante implausível, reenviada do buffer de um boot sem
+    NTP, retorna None: o instante faz parte da chave que descarta reenvios,
+    e o de recebimento mudaria a cada um.
+    """
+    if not reading.ts:
+        return received_at
+    created_at = datetime.fromtimestamp(reading.ts, UTC)
+    skew = timedelta(seconds=app.config['INGEST_MAX_CLOCK_SKEW'])
+    if MIN_DEVICE_TIME <= created_at <= received_at + skew:
+        return created_at
+    if reading.seq is None:
+        return received_at
+    return None
+
+
+@mqtt.on_message()
+def handle_mqtt_message(client, userdata, message):
+    decode = DECODERS.get(message.topic)
+    if decode is None:
+        return
+    try:
+        readings = decode(message.payload)
+    except DecodeError as error:
+        writer.reject(message.topic, message.payload, str(error))
+        return
+
+    received_at = datetime.now(UTC)
+    untimed = 0
+    for reading in readings:
+        created_at = reading_time(reading, received_at)
+        if created_at is None:
+            untimed += 1
+            continue
+        writer.put(
+            dict(
+                id_device=reading.id_device,
+                temp_value=reading.temp_value,
+                humi_value=reading.humi_value,
+                seq=reading.seq,
+                temp_min=reading.temp_min,
+                temp_max=reading.temp_max,
+                humi_min=reading.humi_min,
+                humi_max=reading.humi_max,
+                samples=reading.samples,
+                heartbeat=reading.heartbeat,
+                created_at=created_at,
+            )
+        )
+    if untimed:
+        # A mensagem inteira vai para a quarentena, para análise; as
+        # medições dela com horário válido seguem para o banco.
+        writer.reject(
+            message.topic,
+            message.payload,
+            f'{untimed} medições numeradas sem horário válido',
+        )
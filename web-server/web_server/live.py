@@ -0,0 +1,69 @@
+from time import monotonic
+from pytz import timezone
+from app import socketio
+
+
+def device_room(id_device):
+    return f'device:{id_device}'
+
+
+def register_event(register):
+    return dict(
+        id_device=register['id_device'],
+        temp_value=register['temp_value'],
+        humi_value=register['humi_value'],
+        last_update=register['created_at']
+        .astimezone(timezone('America/Manaus'))
+        .strftime('%d/%m/%Y %H:%M'),
+    )
+
+
+def alarm_event(alarm):
+    return dict(
+        id_device=alarm['id_device'],
+        variable=alarm['variable'],
+        action=alarm['action'],
+        value=alarm['value'],
+        created_at=alarm['created_at']
+        .astimezone(timezone('America/Manaus'))
+        .strftime('%d/%m/%Y %H:%M'),
+    )
+
+
+class LiveUpdates:
+    """Envia aos painéis abertos a última medição de cada dispositivo.
+
+    As medições de um mesmo dispositivo são agrupadas e no máximo uma
+    mensagem por dispositivo é emitida a cada ``interval`` segundos, para a
+    sala Socket.IO do dispositivo.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}
+        self._emitted_at = {}
+
+    def push(self, registers):
+        for register in registers:
+            self._pending[register['id_device']] = register
+
+    def emit_due(self):
+        now = monotonic()
+        for id_device, register in list(self._pending.items()):
+            emitted_at = self._emitted_at.get(id_device)
+            if emitted_at is not None and now - emitted_at < self.interval:
+                continue
+            socketio.emit(
+                'register',
+                register_event(register),
+                to=device_room(id_device),
+            )
+            self._emitted_at[id_device] = now
+            del self._pending[id_device]
+
+    def alarms(self, events):
+        """Envia os eventos de alarme imediatamente, sem agrupar."""
+        for event in events:
+            socketio.emit(
+                'alarm', alarm_event(event), to=device_room(event['id_device'])
+            )
@@ -1,6 +1,8 @@
 from app import db, app
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import datetime, UTC
 
 
@@ -25,12 +27,48 @@ class TbDevices(db.Model):
 
 class TbRegisters(db.Model):
     __tablename__ = 'tb_registers'
-    id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+    __table_args__ = (
+        db.Index(
+            'ix_tb_registers_id_device_created_at', 'id_device', 'created_at'
+        ),
+        db.Index(
+            'ix_tb_registers_created_at_brin',
+            'created_at',
+            postgresql_using='brin',
+        ),
+        # Torna idempotente o reenvio de medições guardadas no dispositivo.
+        # Em tabela particionada, o índice único precisa conter created_at.
+        db.Index(
+            'ux_tb_registers_id_device_seq',
+            'id_device',
+            'seq',
+            'created_at',
+            unique=True,
+        ),
+        db.PrimaryKeyConstraint('created_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+    id: Mapped[int] = mapped_column(
+        db.Integer, primary_key=True, autoincrement=True
+    )
     id_device: Mapped[str] = mapped_column(db.String(30), nullable=False)
     temp_value: Mapped[int] = mapped_column(db.Float, nullable=False)
     humi_value: Mapped[int] = mapped_column(db.Float, nullable=False)
+    seq: Mapped[int] = mapped_column(db.BigInteger, nullable=True)
+    # Preenchidos só nos agregados de janela enviados pelo dispositivo,
+    # em que temp_value e humi_value são as médias.
+    temp_min: Mapped[float] = mapped_column(db.Float, nullable=True)
+    temp_max: Mapped[float] = mapped_column(db.Float, nullable=True)
+    humi_min: Mapped[float] = mapped_column(db.Float, nullable=True)
+    humi_max: Mapped[float] = mapped_column(db.Float, nullable=True)
+    samples: Mapped[int] = mapped_column(db.Integer, nullable=True)
+    # Heartbeat de um dispositivo que publica por exceção: o valor não
+    # variou além da banda morta desde a medição anterior.
+    heartbeat: Mapped[bool] = mapped_column(db.Boolean, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
-        db.TIMESTAMP (timezone=True), default=lambda : datetime.now(UTC)
+        db.TIMESTAMP (timezone=True),
+        primary_key=True,
+        default=lambda : datetime.now(UTC),
     )
     updated_at: Mapped[datetime] = mapped_column(
         db.TIMESTAMP (timezone=True),
@@ -39,8 +77,102 @@ class TbRegisters(db.Model):
     )
 
 
+class TbDeviceLatest(db.Model):
+    __tablename__ = 'tb_device_latest'
+    id_device: Mapped[str] = mapped_column(db.String(30), primary_key=True)
+    temp_value: Mapped[int] = mapped_column(db.Float, nullable=False)
+    humi_value: Mapped[int] = mapped_column(db.Float, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        db.TIMESTAMP (timezone=True), nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        db.TIMESTAMP (timezone=True),
+        default=lambda : datetime.now(UTC),
+        onupdate=lambda : datetime.now(UTC),
+    )
+
+
+class RollupMixin:
+    id_device: Mapped[str] = mapped_column(db.String(30), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(
+        db.TIMESTAMP (timezone=True), primary_key=True
+    )
+    samples: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    temp_min: Mapped[int] = mapped_column(db.Float, nullable=False)
+    temp_max: Mapped[int] = mapped_column(db.Float, nullable=False)
+    temp_sum: Mapped[int] = mapped_column(db.Float, nullable=False)
+    temp_last: Mapped[int] = mapped_column(db.Float, nullable=False)
+    humi_min: Mapped[int] = mapped_column(db.Float, nullable=False)
+    humi_max: Mapped[int] = mapped_column(db.Float, nullable=False)
+    humi_sum: Mapped[int] = mapped_column(db.Float, nullable=False)
+    humi_last: Mapped[int] = mapped_column(db.Float, nullable=False)
+    last_at: Mapped[datetime] = mapped_column(
+        db.TIMESTAMP (timezone=True), nullable=False
+    )
+
+    @property
+    def temp_mean(self):
+        return self.temp_sum / self.samples
+
+    @property
+    def humi_mean(self):
+        return self.humi_sum / self.samples
+
+
+class TbRegisters1m(RollupMixin, db.Model):
+    __tablename__ = 'tb_registers_1m'
+
+
+class TbRegisters1h(RollupMixin, db.Model):
+    __tablename__ = 'tb_registers_1h'
+
+
+class TbRegisters1d(RollupMixin, db.Model):
+    __tablename__ = 'tb_registers_1d'
+
+
+class TbQuarantine(db.Model):
+    __tablename__ = 'tb_quarantine'
+    id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+    topic: Mapped[str] = mapped_column(db.String(200), nullable=False)
+    payload: Mapped[bytes] = mapped_column(db.LargeBinary, nullable=False)
+    error: Mapped[str] = mapped_column(db.Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        db.TIMESTAMP (timezone=True), default=lambda : datetime.now(UTC)
+    )
+
+
+class TbAlarms(db.Model):
+    __tablename__ = 'tb_alarms'
+    __table_args__ = (
+        db.Index(
+            'ix_tb_alarms_id_device_variable_id', 'id_device', 'variable', 'id'
+        ),
+    )
+    id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+    id_device: Mapped[str] = mapped_column(db.String(30), nullable=False)
+    variable: Mapped[str] = mapped_column(db.String(4), nullable=False)
+    action: Mapped[str] = mapped_column(db.String(10), nullable=False)
+    value: Mapped[float] = mapped_column(db.Float, nullable=False)
+    limit_lower: Mapped[float] = mapped_column(db.Float, nullable=False)
+    limit_upper: Mapped[float] = mapped_column(db.Float, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        db.TIMESTAMP (timezone=True), default=lambda : datetime.now(UTC)
+    )
+
+
 class TbHistory(db.Model):
     __tablename__ = 'tb_history'
+    __table_args__ = (
+        # Atendem às páginas de /history, sem e com filtro de dispositivo.
+        db.Index('ix_tb_history_created_at_id', 'created_at', 'id'),
+        db.Index(
+            'ix_tb_history_id_device_created_at_id',
+            'id_device',
+            'created_at',
+            'id',
+        ),
+    )
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
     id_device: Mapped[str] = mapped_column(db.String(30), nullable=False)
     action: Mapped[str] = mapped_column(db.String(10), nullable=False)
@@ -59,9 +191,205 @@ class TbHistory(db.Model):
         onupdate=lambda : datetime.now(UTC),
     )
 
+def _add_months(moment, months):
+    month = moment.month - 1 + months
+    return moment.replace(year=moment.year + month // 12, month=month % 12 + 1)
+
+
+def _registers_partitioned():
+    return db.session.execute(
+        db.text(
+            'SELECT 1 FROM pg_partitioned_table '
+            "WHERE partrelid = 'tb_registers'::regclass"
+        )
+    ).scalar()
+
+
+def _create_register_partition(start, end):
+    """Cria a partição mensal de tb_registers que começa em ``start``.
+
+    Medições do mês que já estejam na partição padrão são movidas para a
+    nova partição antes de anexá-la, na mesma transação; a partição padrão
+    fica bloqueada até o fim, para nenhuma medição do mês entrar nela nesse
+    meio-tempo.
+    """
+    name = f'tb_registers_y{start:%Y}m{start:%m}'
+    if db.session.execute(
+        db.text('SELECT to_regclass(:name)'), {'name': name}
+    ).scalar():
+        return
+    db.session.execute(
+        db.text(f'CREATE TABLE {name} (LIKE tb_registers INCLUDING DEFAULTS)')
+    )
+    if db.session.execute(
+        db.text("SELECT to_regclass('tb_registers_default')")
+    ).scalar():
+        columns = ', '.join(TbRegisters.__table__.columns.keys())
+        db.session.execute(
+            db.text('LOCK TABLE tb_registers_default IN ACCESS EXCLUSIVE MODE')
+        )
+        moved = db.session.execute(
+            db.text(
+                f'WITH moved AS (DELETE FROM tb_registers_default '
+                f'WHERE created_at >= :start AND created_at < :end '
+                f'RETURNING {columns}) '
+                f'INSERT INTO {name} ({columns}) SELECT {columns} FROM moved'
+            ),
+            {'start': start, 'end': end},
+        ).rowcount
+        if moved:
+            app.logger.info(
+                '%d medições movidas da partição padrão para %s', moved, name
+            )
+    db.session.execute(
+        db.text(
+            f'ALTER TABLE tb_registers ATTACH PARTITION {name} '
+            f"FOR VALUES FROM ('{start.isoformat()}') "
+            f"TO ('{end.isoformat()}')"
+        )
+    )
+
+
+def ensure_register_partitions():
+    """Cria as partições mensais de tb_registers que ainda não existem.
+
+    São criadas a partição do mês corrente e as dos próximos
+    ``REGISTERS_PARTITION_MONTHS_AHEAD`` meses, antes da partição padrão,
+    que só recebe medições fora desse intervalo.
+    """
+    if not _registers_partitioned():
+        return
+    start = datetime.now(UTC).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    for _ in range(app.config['REGISTERS_PARTITION_MONTHS_AHEAD'] + 1):
+        end = _add_months(start, 1)
+        try:
+            _create_register_partition(start, end)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.exception(
+                'Falha ao criar a partição de %s', f'{start:%Y-%m}'
+            )
+        start = end
+    db.session.execute(
+        db.text(
+            'CREATE TABLE IF NOT EXISTS tb_registers_default '
+            'PARTITION OF tb_registers DEFAULT'
+        )
+    )
+    db.session.commit()
+
+
+def drop_expired_register_partitions():
+    """Remove as partições mensais mais antigas que a retenção configurada."""
+    retention = app.config['REGISTERS_RETENTION_MONTHS']
+    if not retention or not _registers_partitioned():
+        return
+    cutoff = _add_months(
+        datetime.now(UTC).replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        ),
+        -retention,
+    )
+    partitions = db.session.execute(
+        db.text(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            "WHERE pg_inherits.inhparent = 'tb_registers'::regclass"
+        )
+    ).scalars()
+    for name in partitions:
+        try:
+            month = datetime.strptime(
+                name, 'tb_registers_y%Ym%m'
+            ).replace(tzinfo=UTC)
+        except ValueError:
+            continue
+        if _add_months(month, 1) <= cutoff:
+            db.session.execute(db.text(f'DROP TABLE {name}'))
+            app.logger.info('Partição %s removida', name)
+    db.session.commit()
+
+
+def open_alarms(ids_device=None):
+    """Retorna o último evento de cada alarme que continua aberto."""
+    stmt = (
+        db.select(TbAlarms)
+        .distinct(TbAlarms.id_device, TbAlarms.variable)
+        .order_by(TbAlarms.id_device, TbAlarms.variable, TbAlarms.id.desc())
+    )
+    if ids_device is not None:
+        stmt = stmt.where(TbAlarms.id_device.in_(ids_device))
+    return [
+        alarm
+        for alarm in db.session.scalars(stmt)
+        if alarm.action == 'ABERTO'
+    ]
+
+
+def seed_device_latest():
+    if db.session.query(TbDeviceLatest).first():
+        return
+    newest = (
+        db.select(
+            TbRegisters.id_device,
+            func.max(TbRegisters.created_at).label('created_at'),
+        )
+        .group_by(TbRegisters.id_device)
+        .subquery()
+    )
+    rows = db.select(
+        TbRegisters.id_device,
+        TbRegisters.temp_value,
+        TbRegisters.humi_value,
+        TbRegisters.created_at,
+    ).join(
+        newest,
+        (newest.c.id_device == TbRegisters.id_device)
+        & (newest.c.created_at == TbRegisters.created_at),
+    ).where(db.true())
+    db.session.execute(
+        pg_insert(TbDeviceLatest)
+        .from_select(
+            ['id_device', 'temp_value', 'humi_value', 'created_at'], rows
+        )
+        .on_conflict_do_nothing()
+    )
+    db.session.commit()
+
+
+def add_missing_columns(model):
+    """Acrescenta a uma tabela existente as colunas novas do modelo.
+
+    ``create_all`` não altera tabelas que já existem. Só as colunas
+    anuláveis são consideradas, porque dispensam valor para as linhas
+    antigas.
+    """
+    table = model.__table__
+    for column in table.columns:
+        if not column.nullable:
+            continue
+        db.session.execute(
+            db.text(
+                f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS '
+                f'{column.name} {column.type.compile(db.engine.dialect)}'
+            )
+        )
+    db.session.commit()
+
+
 def create_database():
-    try:
-        with app.app_context():
+    with app.app_context():
+        try:
             db.create_all()
-    except:
-        pass
\ No newline at end of file
+            add_missing_columns(TbRegisters)
+            for model in (TbRegisters, TbHistory):
+                for index in model.__table__.indexes:
+                    index.create(db.engine, checkfirst=True)
+            ensure_register_partitions()
+            seed_device_latest()
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.exception('Falha ao criar ou atualizar o banco')
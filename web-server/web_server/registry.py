@@ -0,0 +1,79 @@
+import select
+import threading
+from time import sleep
+from sqlalchemy import text
+from app import app, db
+from models import TbDevices
+from devices import DeviceConfig, DeviceRegistry
+
+NOTIFY_CHANNEL = 'device_registry'
+
+
+def load_devices():
+    """Lê o cadastro, ordenado pelo id, no contexto de aplicação ativo."""
+    rows = db.session.execute(
+        db.select(*(getattr(TbDevices, f) for f in DeviceConfig._fields))
+        .order_by(TbDevices.id_device)
+    )
+    return [DeviceConfig(*row) for row in rows]
+
+
+def notify_device_changed(id_device):
+    """Avisa todos os processos, quando a transação atual for confirmada."""
+    db.session.execute(
+        text('SELECT pg_notify(:channel, :id_device)'),
+        dict(channel=NOTIFY_CHANNEL, id_device=id_device),
+    )
+
+
+class RegistryListener:
+    """Invalida o registro ao receber notificações do Postgres.
+
+    Usa uma conexão dedicada, fora do pool, em modo autocommit e com
+    ``LISTEN``. Se a conexão cair, o registro é invalidado, porque
+    notificações podem ter sido perdidas, e a conexão é refeita.
+    """
+
+    def __init__(self, registry, retry_interval=5):
+        self.registry = registry
+        self.retry_interval = retry_interval
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name='registry-listener', daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                app.logger.exception('Falha ao escutar %s', NOTIFY_CHANNEL)
+            sleep(self.retry_interval)
+
+    def _listen(self):
+        with app.app_context():
+            pooled = db.engine.raw_connection()
+        connection = pooled.driver_connection
+        pooled.detach()
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+            self.registry.invalidate()
+            while True:
+                select.select([connection], [], [], 60)
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    self.registry.invalidate(notify.payload)
+        finally:
+            connection.close()
+
+
+registry = DeviceRegistry(load_devices, app.config['DEVICE_REGISTRY_TTL'])
+listener = RegistryListener(registry)
@@ -0,0 +1,106 @@
+from datetime import datetime, UTC
+from pytz import timezone
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app import db
+from models import TbRegisters1m, TbRegisters1h, TbRegisters1d
+from decoder import value_range
+
+ROLLUPS = (
+    (TbRegisters1m, 60),
+    (TbRegisters1h, 60 * 60),
+    (TbRegisters1d, 24 * 60 * 60),
+)
+
+
+def bucket_start(moment, seconds):
+    """Retorna o início do intervalo de ``seconds`` que contém ``moment``.
+
+    Os intervalos são alinhados ao horário de Manaus, assim o agregado
+    diário corresponde ao dia local da fábrica.
+    """
+    offset = moment.astimezone(timezone('America/Manaus')).utcoffset()
+    local = moment.timestamp() + offset.total_seconds()
+    return datetime.fromtimestamp(
+        local - local % seconds - offset.total_seconds(), UTC
+    )
+
+
+def _aggregate(batch, seconds):
+    """Agrega o lote por dispositivo e intervalo.
+
+    Um agregado de janela do dispositivo conta como ``samples`` amostras
+    com a média da janela e contribui com o seu mínimo e máximo.
+    """
+    buckets = {}
+    for register in batch:
+        key = (
+            register['id_device'],
+            bucket_start(register['created_at'], seconds),
+        )
+        temp = register['temp_value']
+        humi = register['humi_value']
+        samples = register.get('samples') or 1
+        temp_min, temp_max = value_range(register, 'temp')
+        humi_min, humi_max = value_range(register, 'humi')
+        rollup = buckets.get(key)
+        if rollup is None:
+            buckets[key] = dict(
+                id_device=key[0],
+                bucket=key[1],
+                samples=samples,
+                temp_min=temp_min,
+                temp_max=temp_max,
+                temp_sum=temp * samples,
+                temp_last=temp,
+                humi_min=humi_min,
+                humi_max=humi_max,
+                humi_sum=humi * samples,
+                humi_last=humi,
+                last_at=register['created_at'],
+            )
+            continue
+        rollup['samples'] += samples
+        rollup['temp_min'] = min(rollup['temp_min'], temp_min)
+        rollup['temp_max'] = max(rollup['temp_max'], temp_max)
+        rollup['temp_sum'] += temp * samples
+        rollup['humi_min'] = min(rollup['humi_min'], humi_min)
+        rollup['humi_max'] = max(rollup['humi_max'], humi_max)
+        rollup['humi_sum'] += humi * samples
+        if register['created_at'] >= rollup['last_at']:
+            rollup['temp_last'] = temp
+            rollup['humi_last'] = humi
+            rollup['last_at'] = register['created_at']
+    return list(buckets.values())
+
+
+def update_rollups(batch):
+    """Incorpora um lote de medições aos agregados de 1 min, 1 h e 1 dia.
+
+    Cada lote é agregado em memória e somado às linhas existentes com um
+    único upsert por tabela, então o custo não depende do histórico bruto.
+    """
+    for model, seconds in ROLLUPS:
+        stmt = pg_insert(model)
+        new = stmt.excluded
+        newer = new.last_at >= model.last_at
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[model.id_device, model.bucket],
+            set_={
+                'samples': model.samples + new.samples,
+                'temp_min': func.least(model.temp_min, new.temp_min),
+                'temp_max': func.greatest(model.temp_max, new.temp_max),
+                'temp_sum': model.temp_sum + new.temp_sum,
+                'temp_last': case(
+                    (newer, new.temp_last), else_=model.temp_last
+                ),
+                'humi_min': func.least(model.humi_min, new.humi_min),
+                'humi_max': func.greatest(model.humi_max, new.humi_max),
+                'humi_sum': model.humi_sum + new.humi_sum,
+                'humi_last': case(
+                    (newer, new.humi_last), else_=model.humi_last
+                ),
+                'last_at': func.greatest(model.last_at, new.last_at),
+            },
+        )
+        db.session.execute(stmt, _aggregate(batch, seconds))
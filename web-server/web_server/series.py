@@ -0,0 +1,83 @@
+import numpy as np
+from app import app, db
+from models import TbRegisters, TbRegisters1m, TbRegisters1h, TbRegisters1d
+from downsample import hold_heartbeats, lttb
+
+ROLLUP_SOURCES = (
+    ('1m', TbRegisters1m, 60),
+    ('1h', TbRegisters1h, 60 * 60),
+    ('1d', TbRegisters1d, 24 * 60 * 60),
+)
+
+
+def _choose_source(start, end):
+    """Escolhe a fonte mais detalhada que cabe em ``SERIES_MAX_ROWS``."""
+    seconds = (end - start).total_seconds()
+    max_rows = app.config['SERIES_MAX_ROWS']
+    if seconds / app.config['SERIES_RAW_PERIOD'] <= max_rows:
+        return 'raw', None
+    for name, model, bucket in ROLLUP_SOURCES:
+        if seconds / bucket <= max_rows:
+            return name, model
+    return ROLLUP_SOURCES[-1][0], ROLLUP_SOURCES[-1][1]
+
+
+def _fetch(id_device, start, end, model):
+    if model is None:
+        stmt = (
+            db.select(
+                TbRegisters.created_at,
+                TbRegisters.temp_value,
+                TbRegisters.humi_value,
+                TbRegisters.heartbeat,
+            )
+            .where(
+                TbRegisters.id_device == id_device,
+                TbRegisters.created_at >= start,
+                TbRegisters.created_at < end,
+            )
+            .order_by(TbRegisters.created_at)
+        )
+    else:
+        stmt = (
+            db.select(
+                model.bucket,
+                model.temp_sum / model.samples,
+                model.humi_sum / model.samples,
+            )
+            .where(
+                model.id_device == id_device,
+                model.bucket >= start,
+                model.bucket < end,
+            )
+            .order_by(model.bucket)
+        )
+    rows = db.session.execute(stmt).all()
+    x = np.fromiter(
+        (row[0].timestamp() * 1000 for row in rows), np.float64, len(rows)
+    )
+    temp = np.fromiter((row[1] for row in rows), np.float64, len(rows))
+    humi = np.fromiter((row[2] for row in rows), np.float64, len(rows))
+    if model is None:
+        heartbeat = np.fromiter(
+            (bool(row[3]) for row in rows), np.bool_, len(rows)
+        )
+        temp = hold_heartbeats(temp, heartbeat)
+        humi = hold_heartbeats(humi, heartbeat)
+    return x, temp, humi
+
+
+def _points(x, y, threshold):
+    selected = lttb(x, y, threshold)
+    return np.column_stack((x[selected], y[selected])).tolist()
+
+
+def build_series(id_device, start, end, points):
+    source, model = _choose_source(start, end)
+    x, temp, humi = _fetch(id_device, start, end, model)
+    return dict(
+        id_device=id_device,
+        source=source,
+        temp=_points(x, temp, points),
+        humi=_points(x, humi, points),
+    )
@@ -0,0 +1,177 @@
+import fcntl
+import logging
+import os
+import struct
+import threading
+import zlib
+from itertools import count
+from time import monotonic
+import msgspec
+
+logger = logging.getLogger(__name__)
+
+# Cada registro: tamanho e CRC32 do conteúdo, seguidos do lote em msgpack
+_RECORD = struct.Struct('!II')
+
+
+class Spool:
+    """Fila em disco para lotes de medições que não puderam ser gravados.
+
+    Os lotes são acrescentados, como registros com tamanho e CRC32, ao fim
+    do segmento atual (``<número>.wal``), que é trocado ao passar de
+    ``segment_bytes``. O ``fsync`` é feito no máximo a cada
+    ``fsync_interval`` segundos, agrupando as escritas desse período. A
+    leitura percorre os segmentos em ordem e os apaga depois de
+    reprocessados. O progresso do reprocessamento de um segmento fica em
+    ``<número>.wal.progress``, para não regravar, depois de uma queda, o
+    que já tinha sido gravado.
+
+    Cada processo usa o primeiro subdiretório livre de ``directory``
+    (``0``, ``1``, ...), reservado com ``flock``, então réplicas que
+    compartilham o volume não se misturam e um processo novo assume o
+    spool de um que saiu. O número do subdiretório fica em ``slot``.
+    """
+
+    def __init__(self, directory, segment_bytes, fsync_interval):
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.slot, self.directory, self._lock_file = self._claim(directory)
+        self._lock = threading.Lock()
+        self._file = None
+        self._synced_at = monotonic()
+        self._encoder = msgspec.msgpack.Encoder()
+        self._decoder = msgspec.msgpack.Decoder()
+        segments = self.segments()
+        self._next = int(segments[-1][:-4]) + 1 if segments else 0
+
+    @staticmethod
+    def _claim(directory):
+        for slot in count():
+            path = os.path.join(directory, str(slot))
+            os.makedirs(path, exist_ok=True)
+            lock_file = open(os.path.join(path, '.lock'), 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue
+            return slot, path, lock_file
+
+    def segments(self):
+        """Nomes dos segmentos existentes, do mais antigo ao mais novo."""
+        names = os.listdir(self.directory)
+        return sorted(
+            (name for name in names if name.endswith('.wal')),
+            key=lambda name: int(name[:-4]),
+        )
+
+    def depth(self):
+        """Quantidade de segmentos e de bytes aguardando reprocessamento."""
+        segments = self.segments()
+        size = sum(
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in segments
+        )
+        return len(segments), size
+
+    def pending(self):
+        return bool(self.segments())
+
+    def append(self, batch):
+        data = self._encoder.encode(batch)
+        with self._lock:
+            if self._file is None:
+                self._file = open(
+                    os.path.join(self.directory, f'{self._next}.wal'), 'ab'
+                )
+                self._next += 1
+            self._file.write(_RECORD.pack(len(data), zlib.crc32(data)))
+            self._file.write(data)
+            self._file.flush()
+            if monotonic() - self._synced_at >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._synced_at = monotonic()
+            if self._file.tell() >= self.segment_bytes:
+                self._close()
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._synced_at = monotonic()
+
+    def seal(self):
+        """Fecha o segmento atual e retorna os segmentos fechados.
+
+        Escritas feitas depois disso vão para um segmento novo, que não
+        entra na lista.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._close()
+            return [
+                name for name in self.segments() if int(name[:-4]) < self._next
+            ]
+
+    def _close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._synced_at = monotonic()
+
+    def read(self, name):
+        """Retorna os lotes de um segmento fechado.
+
+        Um registro incompleto ou corrompido, como o último de um segmento
+        interrompido por uma queda, encerra a leitura do segmento.
+        """
+        batches = []
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + _RECORD.size <= len(data):
+            size, crc = _RECORD.unpack_from(data, offset)
+            payload = data[offset + _RECORD.size:offset + _RECORD.size + size]
+            if len(payload) != size or zlib.crc32(payload) != crc:
+                logger.warning(
+                    'Registro inválido em %s, byte %d: restante descartado',
+                    name,
+                    offset,
+                )
+                break
+            batches.append(self._decoder.decode(payload))
+            offset += _RECORD.size + size
+        return batches
+
+    def progress(self, name):
+        """Quantidade de medições do segmento já reprocessadas."""
+        try:
+            with open(self._progress_path(name)) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def set_progress(self, name, replayed):
+        """Guarda, de forma atômica e durável, o progresso do segmento."""
+        path = self._progress_path(name)
+        with open(f'{path}.tmp', 'w') as f:
+            f.write(str(replayed))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f'{path}.tmp', path)
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def _progress_path(self, name):
+        return os.path.join(self.directory, f'{name}.progress')
+
+    def remove(self, name):
+        os.remove(os.path.join(self.directory, name))
+        try:
+            os.remove(self._progress_path(name))
+        except FileNotFoundError:
+            pass
@@ -6,19 +6,69 @@ from flask import (
     flash,
     url_for,
     jsonify,
+    abort,
+    Response,
+    stream_with_context,
 )
 from sqlalchemy import func
-from app import app, db, mqtt, MQTT_CONFIG_TOPIC, MQTT_SENSOR_TOPIC
-from models import TbDevices, TbRegisters, TbHistory
+from flask_socketio import emit, join_room
+from app import app, db, mqtt, socketio, MQTT_CONFIG_TOPIC
+from models import (
+    TbDevices,
+    TbRegisters,
+    TbHistory,
+    TbDeviceLatest,
+    TbAlarms,
+    open_alarms,
+)
 from helpers import (
     FormDevice,
+    FormFilter,
+    filter_query,
+    paginate,
 )
+from export import export_csv, export_parquet
+from live import device_room, register_event, alarm_event
+from registry import registry, notify_device_changed
+from series import build_series
 from pytz import timezone
-from datetime import datetime
+from datetime import datetime, timedelta, UTC
 import json
 from dataclasses import dataclass
 
 
+def config_topic(id_device):
+    return f'{MQTT_CONFIG_TOPIC}/{id_device}'
+
+
+def publish_device_config(device):
+    """Publica a configuração como mensagem retida no tópico do dispositivo.
+
+    O broker guarda a última mensagem de cada tópico e a entrega assim que
+    o dispositivo se inscreve, então um dispositivo que reinicia recebe a
+    configuração atual sem depender do servidor.
+    """
+    device_message = json.dumps(
+        {
+            'MQTT_CLIENT': device.id_device,
+            'TEMP_LIMIT_UPPER': device.temp_limit_upper,
+            'TEMP_LIMIT_LOWER': device.temp_limit_lower,
+            'TEMP_SETTING': device.temp_limit_setting,
+            'HUMI_LIMIT_UPPER': device.humi_limit_upper,
+            'HUMI_LIMIT_LOWER': device.humi_limit_lower,
+            'HUMI_SETTING': device.humi_limit_setting,
+        }
+    )
+    mqtt.publish(
+        config_topic(device.id_device), device_message, qos=1, retain=True
+    )
+
+
+def clear_device_config(id_device):
+    """Remove a mensagem retida do tópico de configuração do dispositivo."""
+    mqtt.publish(config_topic(id_device), b'', qos=1, retain=True)
+
+
 @dataclass
 class Device:
     id_device: str
@@ -31,40 +81,55 @@ class Device:
     last_update: str
 
 
-@mqtt.on_message()
-def handle_mqtt_message(client, userdata, message):
-    data = dict(
-        topic=message.topic, payload=json.loads(message.payload.decode())
-    )
+@socketio.on('subscribe')
+def handle_subscribe(ids_device):
+    if not isinstance(ids_device, list):
+        return
+    ids_device = [str(id_device) for id_device in ids_device]
+    for id_device in ids_device:
+        join_room(device_room(id_device))
 
-    if data['topic'] == MQTT_SENSOR_TOPIC:
-        new_register = TbRegisters(
-            id_device=data['payload']['id_device'],
-            temp_value=data['payload']['temp_value'],
-            humi_value=data['payload']['humi_value'],
+    latest = TbDeviceLatest.query.filter(
+        TbDeviceLatest.id_device.in_(ids_device)
+    )
+    for register in latest:
+        emit(
+            'register',
+            register_event(
+                dict(
+                    id_device=register.id_device,
+                    temp_value=register.temp_value,
+                    humi_value=register.humi_value,
+                    created_at=register.created_at,
+                )
+            ),
+        )
+    for alarm in open_alarms(ids_device):
+        emit(
+            'alarm',
+            alarm_event(
+                dict(
+                    id_device=alarm.id_device,
+                    variable=alarm.variable,
+                    action=alarm.action,
+                    value=alarm.value,
+                    created_at=alarm.created_at,
+                )
+            ),
         )
-        with app.app_context():
-            db.session.add(new_register)
-            db.session.commit()
 
 
 @app.route('/')
 def index():
-    devices = db.session.query(TbDevices).distinct(TbDevices.id_device).all()
+    latest = {
+        register.id_device: register
+        for register in TbDeviceLatest.query.all()
+    }
     data = []
 
-    for device in devices:
-        last_register = (
-            db.session.query(TbRegisters)
-            .join(
-                TbDevices,
-                TbDevices.id_device == TbRegisters.id_device,
-            )
-            .filter(TbDevices.id_device == device.id_device)
-            .order_by(TbRegisters.created_at.desc())
-            .first()
-        )
-        if last_register:
+    for device in registry.all():
+        register = latest.get(device.id_device)
+        if register:
             data.append(
                 Device(
                     device.id_device,
@@ -72,9 +137,9 @@ def index():
                     device.temp_limit_lower,
                     device.humi_limit_upper,
                     device.humi_limit_lower,
-                    last_register.temp_value,
-                    last_register.humi_value,
-                    last_register.created_at.astimezone(
+                    register.temp_value,
+                    register.humi_value,
+                    register.created_at.astimezone(
                         timezone('America/Manaus')
                     ).strftime('%d/%m/%Y %H:%M'),
                 )
@@ -96,9 +161,33 @@ def index():
     return render_template('dashboard.html', title='Painel', data=data)
 
 
+@app.route('/api/devices/<id_device>/series')
+def device_series(id_device):
+    local = timezone('America/Manaus')
+    try:
+        end = request.args.get('to')
+        end = datetime.fromisoformat(end) if end else datetime.now(UTC)
+        start = request.args.get('from')
+        start = (
+            datetime.fromisoformat(start) if start else end - timedelta(days=1)
+        )
+        points = int(request.args.get('points', 500))
+    except ValueError:
+        return jsonify(error='Parâmetros inválidos'), 400
+    if start.tzinfo is None:
+        start = local.localize(start)
+    if end.tzinfo is None:
+        end = local.localize(end)
+    if start >= end or points < 3:
+        return jsonify(error='Parâmetros inválidos'), 400
+
+    points = min(points, app.config['SERIES_MAX_POINTS'])
+    return jsonify(build_series(id_device, start, end, points))
+
+
 @app.route('/devices')
 def devices():
-    lista = TbDevices.query.order_by(TbDevices.id_device)
+    lista = registry.all()
     return render_template('devices.html', title='Dispositivos', devices=lista)
 
 
@@ -106,9 +195,48 @@ def devices():
 def registers():
     if 'user_logged' not in session or session['user_logged'] == None:
         return redirect(url_for('login', next=url_for('registers')))
-    lista = TbRegisters.query.order_by(TbRegisters.id)
+    form = FormFilter(request.args)
+    query = TbRegisters.query
+    if form.validate():
+        query = filter_query(query, TbRegisters, form)
+    lista, next_cursor = paginate(
+        query,
+        TbRegisters,
+        request.args.get('cursor'),
+        app.config['REGISTERS_PAGE_SIZE'],
+    )
     return render_template(
-        'registers.html', title='Registros', registers=lista
+        'registers.html',
+        title='Registros',
+        registers=lista,
+        form=form,
+        next_cursor=next_cursor,
+    )
+
+
+@app.route('/registers/export')
+def registers_export():
+    if 'user_logged' not in session or session['user_logged'] == None:
+        return redirect(url_for('login', next=url_for('registers')))
+    form = FormFilter(request.args)
+    if not form.validate():
+        abort(400)
+    query = filter_query(TbRegisters.query, TbRegisters, form)
+
+    if request.args.get('format', 'csv') == 'parquet':
+        body, mimetype, extension = (
+            export_parquet(query),
+            'application/vnd.apache.parquet',
+            'parquet',
+        )
+    else:
+        body, mimetype, extension = export_csv(query), 'text/csv', 'csv'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename=registros.{extension}'
+        },
     )
 
 
@@ -116,8 +244,23 @@ def registers():
 def history():
     if 'user_logged' not in session or session['user_logged'] == None:
         return redirect(url_for('login', next=url_for('history')))
-    lista = TbHistory.query.order_by(TbHistory.id)
-    return render_template('history.html', title='Histórico', registers=lista)
+    form = FormFilter(request.args)
+    query = TbHistory.query
+    if form.validate():
+        query = filter_query(query, TbHistory, form)
+    lista, next_cursor = paginate(
+        query,
+        TbHistory,
+        request.args.get('cursor'),
+        app.config['REGISTERS_PAGE_SIZE'],
+    )
+    return render_template(
+        'history.html',
+        title='Histórico',
+        registers=lista,
+        form=form,
+        next_cursor=next_cursor,
+    )
 
 
 @app.route('/new')
@@ -177,20 +320,11 @@ def create():
 
     db.session.add(new_device)
     db.session.add(new_history)
+    notify_device_changed(id_device)
     db.session.commit()
+    registry.invalidate(id_device)
 
-    device_message = json.dumps(
-        {
-            'MQTT_CLIENT': id_device,
-            'TEMP_LIMIT_UPPER': temp_limit_upper,
-            'TEMP_LIMIT_LOWER': temp_limit_lower,
-            'TEMP_SETTING': temp_limit_setting,
-            'HUMI_LIMIT_UPPER': humi_limit_upper,
-            'HUMI_LIMIT_LOWER': humi_limit_lower,
-            'HUMI_SETTING': humi_limit_setting,
-        }
-    )
-    mqtt.publish(MQTT_CONFIG_TOPIC, device_message)
+    publish_device_config(new_device)
 
     flash(f"Dispositivo '{form.id_device.data}' criado com sucesso!")
     return redirect(url_for('devices'))
@@ -202,7 +336,9 @@ def edit(id_device):
         return redirect(
             url_for('login', next=url_for('edit', id_device=id_device))
         )
-    device = TbDevices.query.filter_by(id_device=id_device).first()
+    device = registry.get(id_device)
+    if device is None:
+        abort(404)
     form = FormDevice()
     form.id_device.data = device.id_device
     form.temp_limit_upper.data = device.temp_limit_upper
@@ -252,21 +388,11 @@ def update():
 
         db.session.add(new_history)
         db.session.add(device)
+        notify_device_changed(device.id_device)
         db.session.commit()
+        registry.invalidate(device.id_device)
 
-        device_message = json.dumps(
-            {
-                'MQTT_CLIENT': device.id_device,
-                'TEMP_LIMIT_UPPER': device.temp_limit_upper,
-                'TEMP_LIMIT_LOWER': device.temp_limit_lower,
-                'TEMP_SETTING': device.temp_limit_setting,
-                'HUMI_LIMIT_UPPER': device.humi_limit_upper,
-                'HUMI_LIMIT_LOWER': device.humi_limit_lower,
-                'HUMI_SETTING': device.humi_limit_setting,
-            }
-        )
-
-        mqtt.publish(MQTT_CONFIG_TOPIC, device_message)
+        publish_device_config(device)
         flash(
             f'Dispositivo \'{request.form["id_device"]}\' modificado com sucesso!'
         )
@@ -281,6 +407,8 @@ def delete(id_device):
         return redirect(url_for('login'))
 
     device = TbDevices.query.filter_by(id_device=id_device).first()
+    if device is None:
+        abort(404)
 
     new_history = TbHistory(
         id_device=device.id_device,
@@ -293,10 +421,27 @@ def delete(id_device):
         humi_limit_setting=device.humi_limit_setting,
     )
     db.session.add(new_history)
+    # Os alarmes abertos são fechados e a última medição sai do painel, na
+    # mesma transação da remoção do cadastro.
+    for alarm in open_alarms([id_device]):
+        db.session.add(
+            TbAlarms(
+                id_device=id_device,
+                variable=alarm.variable,
+                action='FECHADO',
+                value=alarm.value,
+                limit_lower=alarm.limit_lower,
+                limit_upper=alarm.limit_upper,
+            )
+        )
+    db.session.execute(
+        db.delete(TbDeviceLatest).where(TbDeviceLatest.id_device == id_device)
+    )
+    db.session.delete(device)
+    notify_device_changed(id_device)
     db.session.commit()
-
-    TbDevices.query.filter_by(id_device=id_device).delete()
-    db.session.commit()
+    registry.invalidate(id_device)
+    clear_device_config(id_device)
     flash(f"Dispositivo '{id_device}' deletado com sucesso!")
 
     return redirect(url_for('devices'))
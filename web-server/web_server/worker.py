@@ -0,0 +1,36 @@
+"""Processo de ingestão das medições, separado do servidor web.
+
+Assina o tópico de medições e grava os dados no banco usando os mesmos
+modelos e o mesmo tratamento de mensagens do servidor web, mas não inicia
+o servidor HTTP. Assim o servidor web pode rodar com ``MQTT_INGEST=0`` e
+cada parte escala de forma independente.
+"""
+from os import environ
+
+environ.setdefault('MQTT_INGEST', '1')
+
+import logging
+import signal
+import threading
+from app import app, mqtt, MQTT_INGEST
+from ingest import writer
+
+
+def main():
+    if not MQTT_INGEST:
+        raise SystemExit('MQTT_INGEST=0: o processo de ingestão não assina')
+
+    app.logger.setLevel(logging.INFO)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    stop.wait()
+
+    # Sem cancelar as assinaturas: o broker continua guardando as medições
+    # para a sessão, que o processo seguinte retoma.
+    mqtt.client.disconnect()
+    writer.stop()
+
+
+if __name__ == '__main__':
+    main()